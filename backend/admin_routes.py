@@ -1,44 +1,87 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, Response, jsonify, request
 import sqlite3
-from functools import wraps
+from instrumentation import connect
+from pipeline import admin_required, current_identity, login_required
+from responses import json_response
+from image_index import get_index, image_file_path, stored_forms
+from similarity import get_store
+from cache import result_cache, cache_key, table_versions, bump_version
+from cleanup import run_cleanup, last_report
+from backup import SnapshotBusy, create_snapshot, list_snapshots
+from popularity import SORT_ORDERS, ensure_stats_table, record_wear, sort_rows, sorted_queries
+import post_search
+import events
+from storage import (CATALOG_SHARD, all_shards, connect_shard, connect_user, scatter,
+                     shard_for, shard_of_id, user_shards, valid_item_id)
 
 admin_routes = Blueprint("admin_routes", __name__)
 
 
 def get_db():
-    conn = sqlite3.connect("database.db")
+    conn = connect("database.db")
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def admin_required(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        print(f"Admin check: session role = {session.get('role')}")
-        if session.get("role") != "admin":
-            return jsonify({"error": "Unauthorized"}), 403
-        return f(*args, **kwargs)
+def format_image_path(image_path):
+    """Make sure an image path points at the /clothes/ route"""
+    if not image_path.startswith("/clothes/"):
+        image_path = f"/clothes/{image_path}"
+    return image_path
 
-    return wrapper
 
-
-def login_required(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        print(f"Login check: session username = {session.get('username')}")
-        if 'username' not in session:
-            return jsonify({"error": "Login required"}), 401
-        return f(*args, **kwargs)
-
-    return wrapper
+def announce_clothing(item_id, name, type_, body_part, image_path, username):
+    """Tell admin streams about a new item; it lives on a shard, so the event commits separately"""
+    try:
+        events.emit("clothing_added", {
+            "id": item_id,
+            "name": name,
+            "type": type_,
+            "body_part": body_part,
+            "image_path": format_image_path(image_path),
+            "username": username
+        })
+    except sqlite3.Error as e:
+        print(f"Could not record clothing event: {e}")
+
+
+def find_duplicates(image_path, username):
+    """Items in username's wardrobe or the shared catalog whose image looks like image_path.
+
+    The image itself counts, so re-adding a file that is already in use is
+    caught too. username None checks the shared catalog alone. Only rows
+    naming one of the matched files are read, through idx_clothes_image.
+    """
+    matches = get_index().matching_files(image_path)
+    if not matches:
+        return []
+    forms = sorted(form for path in matches for form in stored_forms(path))
+
+    def candidate_rows(conn, index):
+        query = f"SELECT id, name, image_path FROM clothes WHERE image_path IN ({','.join('?' * len(forms))})"
+        if username:
+            return conn.execute(query + " AND (username = ? OR username IS NULL)", forms + [username]).fetchall()
+        return conn.execute(query + " AND username IS NULL", forms).fetchall()
+
+    shards = user_shards(username, include_catalog=True) if username else [CATALOG_SHARD]
+    duplicates = []
+    for rows in scatter(shards, candidate_rows):
+        for row in rows:
+            distance = matches.get(image_file_path(row["image_path"]))
+            if distance is not None:
+                duplicates.append({
+                    "id": row["id"],
+                    "name": row["name"],
+                    "image_path": format_image_path(row["image_path"]),
+                    "distance": distance
+                })
+    duplicates.sort(key=lambda item: item["distance"])
+    return duplicates
 
 
 # -------------------- CLOTHING MANAGEMENT --------------------
-@admin_routes.route("/user/add-clothing", methods=["POST", "OPTIONS"])
+@admin_routes.route("/user/add-clothing", methods=["POST"])
 def user_add_clothing():
-    if request.method == "OPTIONS":
-        return '', 200
-
     print("User add clothing called")
     data = request.get_json()
     print(f"Received data: {data}")
@@ -54,29 +97,25 @@ def user_add_clothing():
     if not all([name, type_, body_part, image_path]):
         return jsonify({"error": "All fields are required"}), 400
 
-    conn = get_db()
-    try:
-        # Create clothes table if it doesn't exist
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS clothes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL,
-                body_part TEXT NOT NULL,
-                image_path TEXT NOT NULL,
-                username TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+    username = current_identity().username or "anonymous"
+    duplicates = find_duplicates(image_path, username)
+    if duplicates and not data.get("allow_duplicate"):
+        return jsonify({"error": "A very similar image already exists", "duplicates": duplicates}), 409
 
+    # The item goes on its owner's shard, which creates the tables if needed
+    conn = connect_user(username)
+    try:
         # Insert the new clothing item
-        username = session.get("username", "anonymous")
-        conn.execute("""
+        cursor = conn.execute("""
             INSERT INTO clothes (name, type, body_part, image_path, username) 
             VALUES (?, ?, ?, ?, ?)
         """, (name, type_, body_part, image_path, username))
+        bump_version(conn, "clothes")
 
         conn.commit()
+        get_index().add(image_path)
+        get_store().add(cursor.lastrowid, image_path)
+        announce_clothing(cursor.lastrowid, name, type_, body_part, image_path, username)
         print(f"Successfully added clothing item: {name}")
         return jsonify({"message": "Clothing item added successfully!"}), 201
 
@@ -87,12 +126,9 @@ def user_add_clothing():
         conn.close()
 
 
-@admin_routes.route("/admin/add-clothing", methods=["POST", "OPTIONS"])
+@admin_routes.route("/admin/add-clothing", methods=["POST"])
 @admin_required
 def admin_add_clothing():
-    if request.method == "OPTIONS":
-        return '', 200
-
     data = request.get_json()
 
     if not data:
@@ -106,28 +142,25 @@ def admin_add_clothing():
     if not all([name, type_, body_part, image_path]):
         return jsonify({"error": "All fields are required"}), 400
 
-    conn = get_db()
-    try:
-        # Create clothes table if it doesn't exist
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS clothes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL,
-                body_part TEXT NOT NULL,
-                image_path TEXT NOT NULL,
-                username TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+    # Catalog items are only checked against the catalog
+    duplicates = find_duplicates(image_path, None)
+    if duplicates and not data.get("allow_duplicate"):
+        return jsonify({"error": "A very similar image already exists", "duplicates": duplicates}), 409
 
+    # Admin items have no owner and belong to the shared catalog
+    conn = connect_shard(CATALOG_SHARD)
+    try:
         # Insert the new clothing item
-        conn.execute("""
+        cursor = conn.execute("""
             INSERT INTO clothes (name, type, body_part, image_path) 
             VALUES (?, ?, ?, ?)
         """, (name, type_, body_part, image_path))
+        bump_version(conn, "clothes")
 
         conn.commit()
+        get_index().add(image_path)
+        get_store().add(cursor.lastrowid, image_path)
+        announce_clothing(cursor.lastrowid, name, type_, body_part, image_path, None)
         return jsonify({"message": "Clothing item added successfully!"}), 201
 
     except Exception as e:
@@ -138,11 +171,8 @@ def admin_add_clothing():
 
 
 # -------------------- FILTER CLOTHES --------------------
-@admin_routes.route("/filter", methods=["GET", "OPTIONS"])
+@admin_routes.route("/filter", methods=["GET"])
 def filter_clothes():
-    if request.method == "OPTIONS":
-        return '', 200
-
     # Check if this is an API request (has query parameters or Accept header indicates JSON)
     accept_header = request.headers.get('Accept', '')
     has_params = bool(request.args)
@@ -156,83 +186,194 @@ def filter_clothes():
     type_ = request.args.get("type", "").strip()
     part = request.args.get("part", "").strip()
     name = request.args.get("name", "").strip()
+    # scope=mine limits results to the session user's wardrobe,
+    # shared=1 adds the catalog items that have no owner
+    scope = request.args.get("scope", "all").strip().lower()
+    include_shared = request.args.get("shared", "").lower() in ("1", "true", "yes")
+    sort = request.args.get("sort", "").strip().lower()
+    if sort and sort not in SORT_ORDERS:
+        return jsonify({"error": "sort must be 'popular' or 'recent'"}), 400
+
+    username = current_identity().username
+    if scope == "mine" and not username:
+        return jsonify({"error": "Login required"}), 401
+
+    print(f"Filter params: type={type_}, part={part}, name={name}, scope={scope}")
+
+    # A user's own rows live on one shard, the shared catalog on another
+    if scope == "mine":
+        shards = user_shards(username, include_catalog=include_shared)
+    else:
+        shards = all_shards()
+
+    # {t} is the table whose username and body_part the query filters on:
+    # clothes, or item_stats which copies them for sorted reads
+    where = "1=1"
+    params = []
+
+    if scope == "mine":
+        if include_shared:
+            where += " AND ({t}.username = ? OR {t}.username IS NULL)"
+        else:
+            where += " AND {t}.username = ?"
+        params.append(username)
+
+    # Add filters if provided, NOCASE comparisons can use idx_clothes_owner
+    if type_:
+        where += " AND clothes.type = ? COLLATE NOCASE"
+        params.append(type_)
+    if part:
+        where += " AND {t}.body_part = ? COLLATE NOCASE"
+        params.append(part)
+    if name:
+        where += " AND LOWER(clothes.name) LIKE LOWER(?)"
+        params.append(f"%{name}%")
+
+    # Sorted results also read the wear counters, in the order of their index
+    if sort:
+        queries = sorted_queries(where, params, sort)
+    else:
+        queries = [("SELECT id, name, type, body_part, image_path FROM clothes "
+                    f"WHERE {where.format(t='clothes')} ORDER BY name ASC", params)]
+
+    tables = ("clothes", "item_stats") if sort else ("clothes",)
+
+    def read_versions(conn, index):
+        return table_versions(conn, tables)
+
+    def run_query(conn, index):
+        if sort:
+            ensure_stats_table(conn)
+            # Keeps the counters' owner columns if this filled them in
+            conn.commit()
+        return [row for sql, args in queries for row in conn.execute(sql, args).fetchall()]
 
-    print(f"Filter params: type={type_}, part={part}, name={name}")
-
-    conn = get_db()
     try:
-        # Create clothes table if it doesn't exist
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS clothes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL,
-                body_part TEXT NOT NULL,
-                image_path TEXT NOT NULL,
-                username TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        cursor = conn.cursor()
-
-        # Base query
-        query = "SELECT name, type, body_part, image_path FROM clothes WHERE 1=1"
-        params = []
-
-        # Add filters if provided
-        if type_:
-            query += " AND LOWER(type) = LOWER(?)"
-            params.append(type_)
-        if part:
-            query += " AND LOWER(body_part) = LOWER(?)"
-            params.append(part)
-        if name:
-            query += " AND LOWER(name) LIKE LOWER(?)"
-            params.append(f"%{name}%")
-
-        # Add ordering for consistent results
-        query += " ORDER BY name ASC"
-
-        print(f"Executing query: {query} with params: {params}")
-        cursor.execute(query, params)
-        results = cursor.fetchall()
+        # Read the versions before querying, a racing write then only makes the entry stale
+        key = cache_key("filter", request.args, user=username if scope == "mine" else None)
+        versions = tuple(scatter(shards, read_versions))
+        items = result_cache.get(key, versions)
+        if items is not None:
+            return json_response(items, prefixes={"image_path": "/clothes/"})
+
+        per_shard = scatter(shards, run_query)
+        results = per_shard[0]
+        if len(per_shard) > 1:
+            results = sort_rows([row for rows in per_shard for row in rows], sort)
         print(f"Found {len(results)} items")
 
         items = []
         for row in results:
-            # Ensure proper image path formatting
-            image_path = row["image_path"]
-            if not image_path.startswith("/clothes/"):
-                image_path = f"/clothes/{image_path}"
-
             items.append({
+                "id": row["id"],
                 "name": row["name"],
                 "type": row["type"],
                 "body_part": row["body_part"],
-                "image_path": image_path
+                "image_path": format_image_path(row["image_path"])
             })
+            if sort:
+                items[-1]["wear_count"] = row["wear_count"] or 0
+                items[-1]["last_worn_at"] = row["last_worn_at"]
 
-        return jsonify(items)
+        result_cache.put(key, versions, items)
+        return json_response(items, prefixes={"image_path": "/clothes/"})
 
     except Exception as e:
         print(f"Database error in filter_clothes: {e}")
         return jsonify({"error": "Database error occurred"}), 500
-    finally:
-        conn.close()
+
+
+# -------------------- SIMILAR ITEMS --------------------
+# Matches are fetched in excess, then cut down to what the caller may see
+SIMILAR_OVERSAMPLE = 4
+MAX_SIMILAR_CANDIDATES = 2000
+
+
+def visible_clothes(item_ids, identity):
+    """Rows for these ids that the caller may see: their own items and the shared catalog"""
+    # Each id carries its shard, so only the shards holding them are read
+    ids_by_shard = {}
+    for item_id in item_ids:
+        if valid_item_id(item_id):
+            ids_by_shard.setdefault(shard_of_id(item_id), []).append(item_id)
+    if not ids_by_shard:
+        return {}
+
+    def fetch_items(conn, index):
+        ids = ids_by_shard[index]
+        placeholders = ",".join("?" * len(ids))
+        query = f"SELECT id, name, type, body_part, image_path FROM clothes WHERE id IN ({placeholders})"
+        if not identity.is_admin:
+            query += " AND (username = ? OR username IS NULL)"
+            ids = ids + [identity.username]
+        return conn.execute(query, ids).fetchall()
+
+    by_id = {}
+    for rows in scatter(sorted(ids_by_shard), fetch_items):
+        by_id.update((row["id"], row) for row in rows)
+    return by_id
+
+
+@admin_routes.route("/api/clothes/<int:item_id>/similar", methods=["GET"])
+@login_required
+def similar_clothes(item_id):
+    try:
+        k = min(max(int(request.args.get("k", 10)), 1), 100)
+    except ValueError:
+        return jsonify({"error": "k must be a number"}), 400
+
+    identity = current_identity()
+    try:
+        if not visible_clothes([item_id], identity):
+            return jsonify({"error": "Item not found"}), 404
+
+        # Scored once; each round only widens the window over the same scores
+        top = get_store().ranking(item_id)
+        if top is None:
+            return jsonify({"error": "No image features for this item"}), 404
+
+        want = k * SIMILAR_OVERSAMPLE
+        while True:
+            matches = top(want)
+            # Items deleted since the vectors were built are skipped too
+            by_id = visible_clothes([match_id for match_id, _ in matches], identity)
+            visible = [(match_id, score) for match_id, score in matches if match_id in by_id]
+            if len(visible) >= k or len(matches) < want or want >= MAX_SIMILAR_CANDIDATES:
+                break
+            want = min(want * SIMILAR_OVERSAMPLE, MAX_SIMILAR_CANDIDATES)
+
+        items = []
+        for match_id, score in visible[:k]:
+            row = by_id[match_id]
+            items.append({
+                "id": row["id"],
+                "name": row["name"],
+                "type": row["type"],
+                "body_part": row["body_part"],
+                "image_path": format_image_path(row["image_path"]),
+                "score": round(score, 4)
+            })
+
+        return json_response(items, prefixes={"image_path": "/clothes/"})
+    except Exception as e:
+        print(f"Error finding similar clothes: {e}")
+        return jsonify({"error": "Database error occurred"}), 500
 
 
 # -------------------- USERS --------------------
-@admin_routes.route("/auth/admin/users", methods=["GET", "OPTIONS"])
+@admin_routes.route("/auth/admin/users", methods=["GET"])
 @admin_required
 def get_users():
-    if request.method == "OPTIONS":
-        return '', 200
-
     conn = get_db()
     try:
-        users = conn.execute("SELECT id, email, username, role, active FROM users").fetchall()
-        return jsonify([dict(u) for u in users])
+        key = cache_key("users", request.args)
+        versions = table_versions(conn, ("users",))
+        users = result_cache.get(key, versions)
+        if users is None:
+            rows = conn.execute("SELECT id, email, username, role, active FROM users").fetchall()
+            users = [dict(u) for u in rows]
+            result_cache.put(key, versions, users)
+        return json_response(users)
     except Exception as e:
         print(f"Error fetching users: {e}")
         return jsonify({"error": "Failed to fetch users"}), 500
@@ -240,12 +381,9 @@ def get_users():
         conn.close()
 
 
-@admin_routes.route("/auth/admin/users/<int:user_id>/toggle_active", methods=["POST", "OPTIONS"])
+@admin_routes.route("/auth/admin/users/<int:user_id>/toggle_active", methods=["POST"])
 @admin_required
 def toggle_user_active(user_id):
-    if request.method == "OPTIONS":
-        return '', 200
-
     conn = get_db()
     try:
         user = conn.execute("SELECT active FROM users WHERE id = ?", (user_id,)).fetchone()
@@ -254,6 +392,8 @@ def toggle_user_active(user_id):
 
         new_status = not user["active"]
         conn.execute("UPDATE users SET active = ? WHERE id = ?", (new_status, user_id))
+        bump_version(conn, "users")
+        events.publish(conn, "user_updated", {"id": user_id, "active": new_status})
         conn.commit()
         return jsonify({"message": "User status updated"})
     except Exception as e:
@@ -263,15 +403,15 @@ def toggle_user_active(user_id):
         conn.close()
 
 
-@admin_routes.route("/auth/admin/users/<int:user_id>/delete", methods=["POST", "OPTIONS"])
+@admin_routes.route("/auth/admin/users/<int:user_id>/delete", methods=["POST"])
 @admin_required
 def delete_user(user_id):
-    if request.method == "OPTIONS":
-        return '', 200
-
     conn = get_db()
     try:
-        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        cursor = conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        bump_version(conn, "users")
+        if cursor.rowcount:
+            events.publish(conn, "user_deleted", {"id": user_id})
         conn.commit()
         return jsonify({"message": "User deleted"})
     except Exception as e:
@@ -282,12 +422,9 @@ def delete_user(user_id):
 
 
 # -------------------- POSTS --------------------
-@admin_routes.route("/auth/admin/posts", methods=["GET", "OPTIONS"])
+@admin_routes.route("/auth/admin/posts", methods=["GET"])
 @admin_required
 def get_posts():
-    if request.method == "OPTIONS":
-        return '', 200
-
     conn = get_db()
     try:
         # Check if posts table exists
@@ -306,8 +443,14 @@ def get_posts():
             """)
             conn.commit()
 
-        posts = conn.execute("SELECT * FROM posts").fetchall()
-        return jsonify([dict(row) for row in posts]), 200
+        key = cache_key("posts", request.args)
+        versions = table_versions(conn, ("posts",))
+        posts = result_cache.get(key, versions)
+        if posts is None:
+            rows = conn.execute("SELECT * FROM posts").fetchall()
+            posts = [dict(row) for row in rows]
+            result_cache.put(key, versions, posts)
+        return json_response(posts)
     except Exception as e:
         print(f"Error fetching posts: {e}")
         return jsonify({"error": "Failed to fetch posts"}), 500
@@ -315,15 +458,39 @@ def get_posts():
         conn.close()
 
 
-@admin_routes.route("/auth/admin/posts/<int:post_id>/approve", methods=["POST", "OPTIONS"])
+@admin_routes.route("/auth/admin/posts/search", methods=["GET"])
 @admin_required
-def approve_post(post_id):
-    if request.method == "OPTIONS":
-        return '', 200
+def search_posts():
+    text = request.args.get("q", "").strip()
+    if not text:
+        return jsonify({"error": "Search text is required"}), 400
+
+    try:
+        page = int(request.args.get("page", 1))
+        per_page = int(request.args.get("per_page", 20))
+    except ValueError:
+        return jsonify({"error": "page and per_page must be numbers"}), 400
+
+    conn = get_db()
+    try:
+        status = request.args.get("status", "").strip() or None
+        return json_response(post_search.search_posts(conn, text, page, per_page, status))
+    except Exception as e:
+        print(f"Error searching posts: {e}")
+        return jsonify({"error": "Failed to search posts"}), 500
+    finally:
+        conn.close()
+
 
+@admin_routes.route("/auth/admin/posts/<int:post_id>/approve", methods=["POST"])
+@admin_required
+def approve_post(post_id):
     conn = get_db()
     try:
-        conn.execute("UPDATE posts SET status = 'approved' WHERE id = ?", (post_id,))
+        cursor = conn.execute("UPDATE posts SET status = 'approved' WHERE id = ?", (post_id,))
+        bump_version(conn, "posts")
+        if cursor.rowcount:
+            events.publish(conn, "post_updated", {"id": post_id, "status": "approved"})
         conn.commit()
         return jsonify({"message": "Post approved"})
     except Exception as e:
@@ -333,15 +500,15 @@ def approve_post(post_id):
         conn.close()
 
 
-@admin_routes.route("/auth/admin/posts/<int:post_id>/delete", methods=["POST", "OPTIONS"])
+@admin_routes.route("/auth/admin/posts/<int:post_id>/delete", methods=["POST"])
 @admin_required
 def delete_post(post_id):
-    if request.method == "OPTIONS":
-        return '', 200
-
     conn = get_db()
     try:
-        conn.execute("DELETE FROM posts WHERE id = ?", (post_id,))
+        cursor = conn.execute("DELETE FROM posts WHERE id = ?", (post_id,))
+        bump_version(conn, "posts")
+        if cursor.rowcount:
+            events.publish(conn, "post_deleted", {"id": post_id})
         conn.commit()
         return jsonify({"message": "Post deleted"})
     except Exception as e:
@@ -351,20 +518,20 @@ def delete_post(post_id):
         conn.close()
 
 
-@admin_routes.route("/auth/admin/posts/<int:post_id>/edit", methods=["POST", "OPTIONS"])
+@admin_routes.route("/auth/admin/posts/<int:post_id>/edit", methods=["POST"])
 @admin_required
 def edit_post(post_id):
-    if request.method == "OPTIONS":
-        return '', 200
-
     data = request.get_json()
     filename = data.get("filename")
     label = data.get("label")
 
     conn = get_db()
     try:
-        conn.execute("UPDATE posts SET title = ?, body = ? WHERE id = ?",
-                     (filename, label, post_id))
+        cursor = conn.execute("UPDATE posts SET title = ?, body = ? WHERE id = ?",
+                              (filename, label, post_id))
+        bump_version(conn, "posts")
+        if cursor.rowcount:
+            events.publish(conn, "post_updated", {"id": post_id, "title": filename, "body": label})
         conn.commit()
         return jsonify({"message": "Post updated"})
     except Exception as e:
@@ -375,12 +542,18 @@ def edit_post(post_id):
 
 
 # -------------------- ANALYTICS DASHBOARD --------------------
-@admin_routes.route("/api/admin/analytics", methods=["GET", "OPTIONS"])
+@admin_routes.route("/api/admin/analytics", methods=["GET"])
 @admin_required
 def get_analytics():
-    if request.method == "OPTIONS":
-        return '', 200
+    try:
+        return jsonify(collect_analytics())
+    except Exception as e:
+        print(f"Error fetching analytics: {e}")
+        return jsonify({"error": "Failed to fetch analytics"}), 500
+
 
+def collect_analytics():
+    """User, clothing and post counts for the dashboard"""
     conn = get_db()
     try:
         # USER STATS
@@ -388,16 +561,16 @@ def get_analytics():
         roles = conn.execute("SELECT role, COUNT(*) as count FROM users GROUP BY role").fetchall()
         role_breakdown = {r["role"]: r["count"] for r in roles}
 
-        # CLOTHING STATS
-        clothing_total = 0
+        # CLOTHING STATS, summed over every shard
         clothing_by_category = {}
 
-        # Check if clothes table exists
-        tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='clothes'").fetchall()
-        if tables:
-            clothing_total = conn.execute("SELECT COUNT(*) FROM clothes").fetchone()[0]
-            categories = conn.execute("SELECT body_part, COUNT(*) as count FROM clothes GROUP BY body_part").fetchall()
-            clothing_by_category = {c["body_part"]: c["count"] for c in categories}
+        def count_clothes(shard, index):
+            return shard.execute("SELECT body_part, COUNT(*) as count FROM clothes GROUP BY body_part").fetchall()
+
+        for categories in scatter(all_shards(), count_clothes):
+            for c in categories:
+                clothing_by_category[c["body_part"]] = clothing_by_category.get(c["body_part"], 0) + c["count"]
+        clothing_total = sum(clothing_by_category.values())
 
         # POST STATS
         post_total = 0
@@ -409,7 +582,7 @@ def get_analytics():
             categories = conn.execute("SELECT status, COUNT(*) as count FROM posts GROUP BY status").fetchall()
             completion_stats = {c["status"]: c["count"] for c in categories}
 
-        return jsonify({
+        return {
             "users": {
                 "total": user_total,
                 "by_role": role_breakdown
@@ -422,37 +595,77 @@ def get_analytics():
                 "total": post_total,
                 "by_status": completion_stats
             }
-        })
-    except Exception as e:
-        print(f"Error fetching analytics: {e}")
-        return jsonify({"error": "Failed to fetch analytics"}), 500
+        }
     finally:
         conn.close()
 
 
+def analytics_versions():
+    """Generations of every table the analytics count, so idle streams skip recounting"""
+    conn = get_db()
+    try:
+        core = table_versions(conn, ("users", "posts"))
+    finally:
+        conn.close()
+    shards = scatter(all_shards(), lambda shard, index: table_versions(shard, ("clothes",)))
+    return core + tuple(shards)
+
+
+# -------------------- LIVE UPDATES --------------------
+@admin_routes.route("/api/admin/events", methods=["GET"])
+@admin_required
+def admin_events():
+    """Server-Sent Events: moderation changes as they happen plus analytics deltas"""
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    # The generator outlives the request context, so it opens its own connections
+    return Response(
+        events.stream(last_event_id, collect_analytics, analytics_versions),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# -------------------- MAINTENANCE --------------------
+@admin_routes.route("/api/admin/cleanup", methods=["GET", "POST"])
+@admin_required
+def cleanup_orphans():
+    try:
+        # GET shows the last scheduled pass, POST runs one now
+        report = run_cleanup() if request.method == "POST" else last_report()
+        return jsonify(report or {"message": "No cleanup has run yet"})
+    except Exception as e:
+        print(f"Error running cleanup: {e}")
+        return jsonify({"error": "Cleanup failed"}), 500
+
+
+@admin_routes.route("/api/admin/backups", methods=["GET", "POST"])
+@admin_required
+def backups():
+    try:
+        # GET lists snapshots, POST takes one now
+        if request.method == "POST":
+            return jsonify(create_snapshot()), 201
+        return jsonify(list_snapshots())
+    except SnapshotBusy as e:
+        return jsonify({"error": f"{e}, try again later"}), 503
+    except Exception as e:
+        print(f"Error with backups: {e}")
+        return jsonify({"error": "Backup failed"}), 500
+
+
 # -------------------- SAVE OUTFIT --------------------
-@admin_routes.route("/save-outfit", methods=["POST", "OPTIONS"])
+@admin_routes.route("/save-outfit", methods=["POST"])
 def save_outfit():
-    if request.method == "OPTIONS":
-        return '', 200
-
     data = request.get_json()
-    username = session.get("username", "anonymous")
+    username = current_identity().username or "anonymous"
 
-    conn = get_db()
+    conn = connect_user(username)
     try:
-        # Create outfits table if it doesn't exist
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS outfits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                top_name TEXT,
-                bottom_name TEXT,
-                shoes_name TEXT,
-                saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
         # Extract outfit data
         top_name = data.get("top", {}).get("name", "Unknown")
         bottom_name = data.get("bottom", {}).get("name", "Unknown")
@@ -464,7 +677,29 @@ def save_outfit():
             VALUES (?, ?, ?, ?)
         """, (username, top_name, bottom_name, shoes_name))
 
+        # Count the wear against each item so popularity sorts need no aggregation.
+        # Counters live with the item, which may be on another shard (e.g. the catalog)
+        item_ids = [data.get(part, {}).get("id") for part in ("top", "bottom", "shoes")]
+        ids_by_shard = {}
+        for item_id in item_ids:
+            # Ids come from the client: only ones in an existing shard's range are looked up
+            if valid_item_id(item_id):
+                ids_by_shard.setdefault(shard_of_id(item_id), []).append(item_id)
+
+        own_ids = ids_by_shard.pop(shard_for(username), [])
+        # Ids without a clothes row on their shard are not counted
+        if own_ids and record_wear(conn, own_ids):
+            bump_version(conn, "item_stats")
         conn.commit()
+
+        for index, ids in ids_by_shard.items():
+            shard = connect_shard(index)
+            try:
+                if record_wear(shard, ids):
+                    bump_version(shard, "item_stats")
+                shard.commit()
+            finally:
+                shard.close()
         return jsonify({"message": "Outfit saved successfully!"}), 200
     except Exception as e:
         print(f"Error saving outfit: {e}")
@@ -1,42 +1,22 @@
 from flask import Blueprint, request, jsonify, session
 import sqlite3
 import bcrypt
-from functools import wraps
+from instrumentation import connect
+from pipeline import current_identity, login_required
+from cache import bump_version
+from events import publish
 
 auth_blueprint = Blueprint("auth", __name__)
 
 
 def get_db():
-    conn = sqlite3.connect("database.db")
+    conn = connect("database.db")
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'role' not in session or session['role'] != 'admin':
-            return jsonify({"error": "Admin access required"}), 403
-        return f(*args, **kwargs)
-
-    return decorated_function
-
-
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'username' not in session:
-            return jsonify({"error": "Login required"}), 401
-        return f(*args, **kwargs)
-
-    return decorated_function
-
-
-@auth_blueprint.route("/register", methods=["POST", "OPTIONS"])
+@auth_blueprint.route("/register", methods=["POST"])
 def register():
-    if request.method == "OPTIONS":
-        return '', 200
-
     data = request.json
     if not data:
         return jsonify({"error": "No data provided"}), 400
@@ -55,6 +35,10 @@ def register():
     try:
         cursor.execute("INSERT INTO users (email, username, password, role, active) VALUES (?, ?, ?, ?, ?)",
                        (email, username, hashed_password.decode("utf-8"), "user", True))
+        bump_version(conn, "users")
+        publish(conn, "user_added", {
+            "id": cursor.lastrowid, "email": email, "username": username, "role": "user", "active": True
+        })
         conn.commit()
         return jsonify({"message": "User registered successfully!"}), 201
     except sqlite3.IntegrityError as e:
@@ -71,11 +55,8 @@ def register():
         conn.close()
 
 
-@auth_blueprint.route("/login", methods=["POST", "OPTIONS"])
+@auth_blueprint.route("/login", methods=["POST"])
 def login():
-    if request.method == "OPTIONS":
-        return '', 200
-
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
@@ -116,11 +97,8 @@ def login():
         conn.close()
 
 
-@auth_blueprint.route("/logout", methods=["POST", "OPTIONS"])
+@auth_blueprint.route("/logout", methods=["POST"])
 def logout():
-    if request.method == "OPTIONS":
-        return '', 200
-
     try:
         username = session.get("username", "Unknown")
         session.clear()
@@ -135,19 +113,20 @@ def logout():
 def check_session():
     """Check if user has a valid session"""
     try:
-        if "username" in session and "role" in session:
+        identity = current_identity()
+        if identity.authenticated and identity.role:
             # Verify user still exists and is active
             conn = get_db()
             cursor = conn.cursor()
-            cursor.execute("SELECT active FROM users WHERE username = ?", (session["username"],))
+            cursor.execute("SELECT active FROM users WHERE username = ?", (identity.username,))
             row = cursor.fetchone()
             conn.close()
 
             if row and row["active"]:
                 return jsonify({
                     "authenticated": True,
-                    "username": session["username"],
-                    "role": session["role"]
+                    "username": identity.username,
+                    "role": identity.role
                 }), 200
             else:
                 session.clear()
@@ -160,12 +139,9 @@ def check_session():
         return jsonify({"authenticated": False}), 401
 
 
-@auth_blueprint.route("/change-password", methods=["POST", "OPTIONS"])
+@auth_blueprint.route("/change-password", methods=["POST"])
 @login_required
 def change_password():
-    if request.method == "OPTIONS":
-        return '', 200
-
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
@@ -176,7 +152,7 @@ def change_password():
     if not old_password or not new_password:
         return jsonify({"error": "Both old and new passwords are required"}), 400
 
-    username = session["username"]
+    username = current_identity().username
 
     conn = get_db()
     cursor = conn.cursor()
@@ -213,6 +189,6 @@ def change_password():
 
 @auth_blueprint.route("/admin/check", methods=["GET"])
 def check_admin():
-    if "username" in session and session.get("role") == "admin":
+    if current_identity().is_admin:
         return jsonify({"access": "granted"}), 200
     return jsonify({"access": "denied"}), 403
\ No newline at end of file
@@ -0,0 +1,314 @@
+# backup.py - Online snapshots of the SQLite databases, with retention and restore
+#
+# Snapshots use SQLite's online backup API, copying a few pages at a time
+# and sleeping in between, so request writers only ever wait for one step.
+#
+#   python backup.py backup             take a snapshot now
+#   python backup.py list               show snapshots, newest first
+#   python backup.py restore <name>     verify and restore a snapshot
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from storage import all_shards, process_lock, shard_path
+
+BACKUP_DIR = os.environ.get("DRESSEZ_BACKUP_DIR", "backups")
+# Seconds between scheduled snapshots, 0 disables the worker
+BACKUP_INTERVAL = int(os.environ.get("DRESSEZ_BACKUP_INTERVAL", "86400"))
+# Number of snapshots kept
+BACKUP_KEEP = int(os.environ.get("DRESSEZ_BACKUP_KEEP", "7"))
+# Pages copied per backup step, and the pause between steps
+STEP_PAGES = 128
+STEP_SLEEP = 0.005
+# Restarts caused by concurrent writes before falling back to a one-step copy
+MAX_RESTARTS = 3
+CHUNK_SIZE = 1024 * 1024
+# Wait before retrying a snapshot that writes kept restarting
+BUSY_RETRY_SECONDS = 300
+# How far a restore moves table versions and id sequences past the live values,
+# covering writes that land between reading them and the copy
+RESTORE_COUNTER_GAP = 1000
+
+# Threads of one process queue on this; other processes are kept out by a
+# lock file in the backup directory
+_run_lock = threading.Lock()
+LOCK_FILE = ".lock"
+PARTIAL_SUFFIX = ".partial"
+
+
+def _databases():
+    """Every database file the app writes to: the core database plus the shards"""
+    paths = [shard_path(index) for index in all_shards()]
+    return [path for path in paths if os.path.exists(path)]
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class SnapshotBusy(Exception):
+    """Writes kept restarting the copy; the snapshot should be retried later"""
+
+
+class SnapshotInProgress(SnapshotBusy):
+    """Another process is taking a snapshot right now"""
+
+
+def _copy_online(source_path, target_path):
+    """Stepped online copy of a database.
+
+    A write from another connection restarts a stepped backup, so under a
+    steady write load it could never finish. After MAX_RESTARTS a WAL
+    database is copied in one step, where the read snapshot doesn't block
+    writers. In rollback journal mode that would hold off every writer for
+    the whole copy, so SnapshotBusy is raised instead.
+    """
+    state = {"remaining": None, "restarts": 0}
+
+    def progress(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state["remaining"] = remaining
+
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=STEP_PAGES, progress=progress, sleep=STEP_SLEEP)
+        except _TooManyRestarts:
+            if source.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+                raise SnapshotBusy(f"{source_path} is too busy to copy without blocking writers")
+            print(f"Backup of {source_path} kept restarting, copying in one step")
+            source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def _compress(path, target_path):
+    """gzip a file, returning the sha256 of the uncompressed bytes"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as raw, gzip.open(target_path, "wb", compresslevel=6) as packed:
+        while True:
+            chunk = raw.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            packed.write(chunk)
+    return digest.hexdigest()
+
+
+def _decompress(path, target_path):
+    digest = hashlib.sha256()
+    with gzip.open(path, "rb") as packed, open(target_path, "wb") as raw:
+        while True:
+            chunk = packed.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            raw.write(chunk)
+    return digest.hexdigest()
+
+
+def create_snapshot(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    """Back up every database into a new snapshot directory; returns its manifest.
+
+    Raises SnapshotInProgress when another process is taking one.
+    """
+    with _run_lock, process_lock(os.path.join(backup_dir, LOCK_FILE)) as locked:
+        if not locked:
+            raise SnapshotInProgress("Another snapshot is in progress")
+        started = time.perf_counter()
+        name = time.strftime("%Y%m%d-%H%M%S")
+        if os.path.exists(os.path.join(backup_dir, name)):
+            name += f"-{int(time.time() * 1000) % 1000:03d}"
+        snapshot_dir = os.path.join(backup_dir, name)
+        partial_dir = tempfile.mkdtemp(prefix=name + ".", suffix=PARTIAL_SUFFIX, dir=backup_dir)
+
+        try:
+            files = []
+            with tempfile.TemporaryDirectory() as scratch:
+                for path in _databases():
+                    copy_path = os.path.join(scratch, os.path.basename(path))
+                    _copy_online(path, copy_path)
+                    archive = os.path.basename(path) + ".gz"
+                    checksum = _compress(copy_path, os.path.join(partial_dir, archive))
+                    files.append({
+                        "database": path,
+                        "archive": archive,
+                        "sha256": checksum,
+                        "bytes": os.path.getsize(copy_path)
+                    })
+
+            manifest = {
+                "name": name,
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "files": files,
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+            with open(os.path.join(partial_dir, "manifest.json"), "w", encoding="utf-8") as out:
+                json.dump(manifest, out, indent=2)
+            # Only complete snapshots get their final name
+            os.replace(partial_dir, snapshot_dir)
+        except BaseException:
+            shutil.rmtree(partial_dir, ignore_errors=True)
+            raise
+
+        prune(backup_dir, keep)
+        print(f"Backup {name}: {len(files)} databases in {manifest['seconds']}s")
+        return manifest
+
+
+def list_snapshots(backup_dir=BACKUP_DIR):
+    """Manifests of complete snapshots, newest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(backup_dir), reverse=True):
+        if name.endswith(PARTIAL_SUFFIX):
+            continue
+        manifest_path = os.path.join(backup_dir, name, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def prune(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    for manifest in list_snapshots(backup_dir)[keep:]:
+        shutil.rmtree(os.path.join(backup_dir, manifest["name"]), ignore_errors=True)
+
+
+def _live_counters(path):
+    """table_versions and AUTOINCREMENT positions of a live database"""
+    if not os.path.exists(path):
+        return {}, {}
+    conn = sqlite3.connect(path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        versions = dict(conn.execute("SELECT name, version FROM table_versions")) if "table_versions" in tables else {}
+        sequences = dict(conn.execute("SELECT name, seq FROM sqlite_sequence")) if "sqlite_sequence" in tables else {}
+        return versions, sequences
+    finally:
+        conn.close()
+
+
+def _carry_counters(copy_path, versions, sequences, gap=RESTORE_COUNTER_GAP):
+    """Move a restored copy's counters past the live database's.
+
+    Running workers cache results by table version and SSE clients resume by
+    event id, so neither may go back to a value already handed out. Raising
+    sqlite_sequence also keeps item ids from being reused.
+    """
+    conn = sqlite3.connect(copy_path)
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS table_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        for name, version in versions.items():
+            conn.execute("""
+                INSERT INTO table_versions (name, version) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET version = MAX(version, excluded.version)
+            """, (name, version))
+        conn.execute("UPDATE table_versions SET version = version + ?", (gap,))
+
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        for name, seq in sequences.items():
+            if name not in tables:
+                continue
+            updated = conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq + gap, name))
+            if not updated.rowcount:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (name, seq + gap))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def restore_snapshot(name, backup_dir=BACKUP_DIR):
+    """Verify every archive of a snapshot, then copy them over the live databases.
+
+    Table versions and id sequences continue past their live values, so
+    running workers' caches and event streams stay valid.
+    """
+    snapshot_dir = os.path.join(backup_dir, name)
+    with open(os.path.join(snapshot_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        # Check everything first so a bad archive can't leave a half-restored set
+        restored = []
+        for entry in manifest["files"]:
+            copy_path = os.path.join(scratch, entry["archive"][:-len(".gz")])
+            checksum = _decompress(os.path.join(snapshot_dir, entry["archive"]), copy_path)
+            if checksum != entry["sha256"]:
+                raise ValueError(f"Checksum mismatch for {entry['archive']} in snapshot {name}")
+            restored.append((copy_path, entry["database"]))
+
+        for copy_path, database in restored:
+            directory = os.path.dirname(database)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _carry_counters(copy_path, *_live_counters(database))
+            # One backup step replaces the live file's pages under a single write lock
+            source = sqlite3.connect(copy_path)
+            target = sqlite3.connect(database)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+
+    print(f"Restored snapshot {name}: {len(restored)} databases")
+    return manifest
+
+
+def start_worker(interval=BACKUP_INTERVAL):
+    """Take a snapshot every `interval` seconds on a daemon thread"""
+    if interval <= 0:
+        return None
+
+    def loop():
+        delay = interval
+        while True:
+            time.sleep(delay)
+            delay = interval
+            try:
+                create_snapshot()
+            except SnapshotInProgress:
+                # Another worker process is taking this round's snapshot
+                pass
+            except SnapshotBusy as e:
+                print(f"Scheduled backup postponed: {e}")
+                delay = BUSY_RETRY_SECONDS
+            except Exception as e:
+                print(f"Scheduled backup failed: {e}")
+
+    worker = threading.Thread(target=loop, name="backup-worker", daemon=True)
+    worker.start()
+    return worker
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "backup"
+    if command == "backup":
+        create_snapshot()
+    elif command == "list":
+        for snapshot in list_snapshots():
+            size = sum(f["bytes"] for f in snapshot["files"])
+            print(f"{snapshot['name']}  {len(snapshot['files'])} databases  {size} bytes")
+    elif command == "restore" and len(sys.argv) > 2:
+        restore_snapshot(sys.argv[2])
+    else:
+        print("usage: python backup.py [backup | list | restore <snapshot>]")
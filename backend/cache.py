@@ -0,0 +1,109 @@
+# cache.py - In-process LRU cache for query results, invalidated by table versions
+import threading
+from collections import OrderedDict
+
+from responses import dumps
+from storage import database_file
+
+# Roughly how much result data (as encoded JSON) a worker keeps around
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+
+# Database files already known to have table_versions
+_version_tables = set()
+
+
+def ensure_version_table(conn):
+    """Create the shared table holding one generation counter per data table"""
+    path = database_file(conn)
+    if path in _version_tables:
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # No commit here: inside a write transaction the DDL commits with the caller
+    _version_tables.add(path)
+
+
+def table_versions(conn, tables):
+    """Current generation of each table, read from the database so every worker agrees"""
+    ensure_version_table(conn)
+    placeholders = ",".join("?" * len(tables))
+    rows = conn.execute(
+        f"SELECT name, version FROM table_versions WHERE name IN ({placeholders})", tables
+    ).fetchall()
+    found = {row[0]: row[1] for row in rows}
+    return tuple(found.get(table, 0) for table in tables)
+
+
+def bump_version(conn, *tables):
+    """Invalidate cached results for tables; call inside the write transaction"""
+    ensure_version_table(conn)
+    for table in tables:
+        conn.execute("""
+            INSERT INTO table_versions (name, version) VALUES (?, 1)
+            ON CONFLICT(name) DO UPDATE SET version = version + 1
+        """, (table,))
+
+
+def cache_key(endpoint, args, **extra):
+    """Normalise query parameters so equivalent requests share an entry"""
+    params = {key.lower(): value.strip().lower() for key, value in args.items() if value.strip()}
+    params.pop("format", None)
+    params.update({key: value for key, value in extra.items() if value is not None})
+    return (endpoint,) + tuple(sorted(params.items()))
+
+
+class ResultCache:
+    """LRU of query results bounded by their encoded size"""
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, versions):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != versions:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, versions, value):
+        size = len(dumps(value))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self.entries[key] = (versions, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,195 @@
+# cleanup.py - Background removal of orphaned clothes/outfits rows and image files
+import os
+import threading
+import time
+
+from cache import bump_version
+from events import prune as prune_events
+from image_index import CLOTHES_DIR, get_index, image_file_path, iter_images
+from instrumentation import connect
+from storage import CORE_DB, all_shards, connect_shard, scatter
+
+# Rows deleted per write transaction, keeps each hold on the write lock short
+BATCH_SIZE = 200
+# Pause between batches so request writes can get in
+BATCH_PAUSE = 0.05
+# Files newer than this may belong to an upload whose row isn't inserted yet
+FILE_GRACE_SECONDS = 3600
+# Seconds between scheduled passes, 0 disables the worker
+CLEANUP_INTERVAL = int(os.environ.get("DRESSEZ_CLEANUP_INTERVAL", "3600"))
+
+# Tables whose rows belong to a username. Items added without a session are
+# stored as 'anonymous' and items with no owner are the shared catalog,
+# neither is an orphan.
+OWNED_QUERIES = {
+    "clothes": """
+        SELECT id, username FROM clothes
+        WHERE id > ? AND username IS NOT NULL AND username != 'anonymous'
+        ORDER BY id LIMIT ?
+    """,
+    "outfits": """
+        SELECT id, username FROM outfits
+        WHERE id > ? AND username != 'anonymous'
+        ORDER BY id LIMIT ?
+    """
+}
+# Wear counters of clothes that are gone, runs after the clothes pass
+STATS_ORPHANS = """
+    SELECT s.item_id FROM item_stats s
+    LEFT JOIN clothes c ON c.id = s.item_id
+    WHERE s.item_id > ? AND c.id IS NULL
+    ORDER BY s.item_id LIMIT ?
+"""
+ORPHAN_TABLES = ("clothes", "outfits", "item_stats")
+# Key column of each table, when it isn't id
+ORPHAN_KEYS = {"item_stats": "item_id"}
+
+_run_lock = threading.Lock()
+_last_report = None
+
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+
+def live_usernames(usernames):
+    """Which of these usernames still have an account, read from the core database"""
+    if not usernames:
+        return set()
+    conn = connect(CORE_DB)
+    try:
+        placeholders = ",".join("?" * len(usernames))
+        rows = conn.execute(f"SELECT username FROM users WHERE username IN ({placeholders})", list(usernames))
+        return {row[0] for row in rows.fetchall()}
+    finally:
+        conn.close()
+
+
+def _find_orphans(conn, table, last_id, batch_size):
+    """(orphan ids, last id scanned, rows scanned) for the next batch of a table"""
+    if table == "item_stats":
+        ids = [row[0] for row in conn.execute(STATS_ORPHANS, (last_id, batch_size)).fetchall()]
+        return ids, ids[-1] if ids else last_id, len(ids)
+
+    rows = conn.execute(OWNED_QUERIES[table], (last_id, batch_size)).fetchall()
+    if not rows:
+        return [], last_id, 0
+    live = live_usernames({row[1] for row in rows})
+    return [row[0] for row in rows if row[1] not in live], rows[-1][0], len(rows)
+
+
+def delete_orphans(table, shard, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    """Delete orphaned rows of a table on one shard in small transactions, returns how many went"""
+    deleted = 0
+    last_id = 0
+    while True:
+        conn = connect_shard(shard)
+        try:
+            # Owners are looked up in the core database before the write
+            # transaction, which then only locks this shard. A username that
+            # signs up again doesn't inherit the old account's rows.
+            ids, last_id, scanned = _find_orphans(conn, table, last_id, batch_size)
+            if ids:
+                conn.execute("BEGIN IMMEDIATE")
+                placeholders = ",".join("?" * len(ids))
+                key = ORPHAN_KEYS.get(table, "id")
+                conn.execute(f"DELETE FROM {table} WHERE {key} IN ({placeholders})", ids)
+                bump_version(conn, table)
+                conn.commit()
+        finally:
+            conn.close()
+
+        deleted += len(ids)
+        if scanned < batch_size:
+            return deleted
+        time.sleep(pause)
+
+
+def delete_unreferenced_files(clothes_dir=CLOTHES_DIR, grace=FILE_GRACE_SECONDS):
+    """Remove images in clothes/ that no clothes row on any shard points at"""
+    def image_paths(conn, index):
+        return conn.execute("SELECT DISTINCT image_path FROM clothes").fetchall()
+
+    referenced = set()
+    for rows in scatter(all_shards(), image_paths):
+        referenced.update(image_file_path(row[0], clothes_dir) for row in rows)
+
+    files = 0
+    reclaimed = 0
+    cutoff = time.time() - grace
+    for path in iter_images(clothes_dir):
+        if path in referenced:
+            continue
+        try:
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue
+            os.remove(path)
+        except OSError as e:
+            print(f"Could not remove {path}: {e}")
+            continue
+        get_index().discard(path)
+        files += 1
+        reclaimed += stat.st_size
+    return files, reclaimed
+
+
+def run_cleanup(clothes_dir=CLOTHES_DIR):
+    """One full pass over every shard; returns a report of what was reclaimed"""
+    global _last_report
+    with _run_lock:
+        started = time.perf_counter()
+        report = {"clothes": 0, "outfits": 0, "item_stats": 0, "events": 0, "files": 0, "bytes": 0}
+
+        # Shards create clothes/outfits and their owner indexes on connect
+        for shard in all_shards():
+            conn = connect_shard(shard)
+            try:
+                tables = [table for table in ORPHAN_TABLES if _table_exists(conn, table)]
+            finally:
+                conn.close()
+            for table in tables:
+                report[table] += delete_orphans(table, shard)
+
+        report["files"], report["bytes"] = delete_unreferenced_files(clothes_dir)
+
+        # Admin streams only replay recent events on reconnect
+        conn = connect(CORE_DB)
+        try:
+            report["events"] = prune_events(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        report["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        _last_report = report
+        print(f"Cleanup reclaimed {report['clothes']} clothes, {report['outfits']} outfits, "
+              f"{report['files']} files ({report['bytes']} bytes) in {report['seconds']}s")
+        return report
+
+
+def last_report():
+    return _last_report
+
+
+def start_worker(interval=CLEANUP_INTERVAL):
+    """Run cleanup passes on a daemon thread every `interval` seconds"""
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                run_cleanup()
+            except Exception as e:
+                print(f"Cleanup pass failed: {e}")
+
+    worker = threading.Thread(target=loop, name="cleanup-worker", daemon=True)
+    worker.start()
+    return worker
+
+
+if __name__ == "__main__":
+    run_cleanup()
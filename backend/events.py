@@ -0,0 +1,152 @@
+# events.py - Change events for the admin pages, pushed over Server-Sent Events
+#
+# Write paths record an event row in the core database, inside the same
+# transaction as the change, so every worker process can stream it and a
+# rolled back write never announces anything. Streams poll the table by
+# primary key, which costs one index range scan per tick.
+import json
+import sqlite3
+import time
+
+from instrumentation import connect
+from storage import CORE_DB, database_file
+
+# How often a stream looks for new events
+POLL_SECONDS = 1.0
+# Comment lines keep proxies from closing an idle stream
+KEEPALIVE_SECONDS = 15.0
+# How often a stream checks whether the analytics counts moved
+ANALYTICS_SECONDS = 10.0
+# Events kept for clients resuming with Last-Event-ID; older ones are pruned by cleanup
+EVENT_RETENTION = 10000
+BATCH_SIZE = 100
+# Sent to EventSource so a dropped stream reconnects quickly
+RETRY_MS = 3000
+
+# Database files already known to have the events table
+_event_tables = set()
+
+
+def ensure_events_table(conn):
+    path = database_file(conn)
+    if path in _event_tables:
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # No commit here: inside a write transaction the DDL commits with the caller
+    _event_tables.add(path)
+
+
+def publish(conn, event_type, data):
+    """Record an event on a core database connection; call inside the write transaction"""
+    ensure_events_table(conn)
+    conn.execute("INSERT INTO events (type, data) VALUES (?, ?)", (event_type, json.dumps(data)))
+
+
+def emit(event_type, data):
+    """Record an event in its own transaction, for changes committed on a shard"""
+    conn = connect(CORE_DB)
+    try:
+        publish(conn, event_type, data)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def latest_id(conn):
+    ensure_events_table(conn)
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+
+def read_since(conn, last_id, limit=BATCH_SIZE):
+    ensure_events_table(conn)
+    return conn.execute(
+        "SELECT id, type, data FROM events WHERE id > ? ORDER BY id LIMIT ?", (last_id, limit)
+    ).fetchall()
+
+
+def prune(conn, keep=EVENT_RETENTION):
+    """Drop all but the newest `keep` events, returns how many went"""
+    ensure_events_table(conn)
+    cursor = conn.execute("DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?", (keep,))
+    return cursor.rowcount
+
+
+def format_event(event_type, data, event_id=None):
+    """One SSE message; data is already JSON text or gets encoded"""
+    if not isinstance(data, str):
+        data = json.dumps(data)
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+def diff(previous, current):
+    """The parts of a nested dict of counts that changed; removed keys come back as 0"""
+    changes = {}
+    for key in current.keys() | previous.keys():
+        old = previous.get(key)
+        new = current.get(key, 0)
+        if isinstance(new, dict):
+            nested = diff(old if isinstance(old, dict) else {}, new)
+            if nested:
+                changes[key] = nested
+        elif old != new:
+            changes[key] = new
+    return changes
+
+
+def stream(last_id=None, analytics=None, analytics_versions=None):
+    """Generator of SSE messages: change events as they are recorded, plus
+    analytics deltas whenever analytics_versions() reports a new generation.
+
+    analytics() returns the dashboard counts; the first delta a stream sends
+    is the full set, later ones only what moved.
+    """
+    conn = connect(CORE_DB)
+    conn.row_factory = sqlite3.Row
+    try:
+        if last_id is None:
+            last_id = latest_id(conn)
+        yield f"retry: {RETRY_MS}\n\n"
+
+        sent_counts = {}
+        counted_versions = None
+        next_analytics = 0.0
+        next_keepalive = time.monotonic() + KEEPALIVE_SECONDS
+        while True:
+            messages = []
+            for row in read_since(conn, last_id):
+                last_id = row["id"]
+                messages.append(format_event(row["type"], row["data"], row["id"]))
+
+            now = time.monotonic()
+            if analytics is not None and now >= next_analytics:
+                next_analytics = now + ANALYTICS_SECONDS
+                versions = analytics_versions() if analytics_versions else None
+                if versions is None or versions != counted_versions:
+                    counted_versions = versions
+                    counts = analytics()
+                    changes = diff(sent_counts, counts)
+                    sent_counts = counts
+                    if changes:
+                        messages.append(format_event("analytics", changes))
+
+            if messages:
+                yield "".join(messages)
+                next_keepalive = now + KEEPALIVE_SECONDS
+            elif now >= next_keepalive:
+                yield ": keepalive\n\n"
+                next_keepalive = now + KEEPALIVE_SECONDS
+            time.sleep(POLL_SECONDS)
+    finally:
+        conn.close()
@@ -0,0 +1,225 @@
+# image_index.py - Perceptual hash index for spotting duplicate clothing images
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+CLOTHES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clothes")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp")
+
+# Max number of differing bits (out of 64) for two images to count as duplicates
+DUPLICATE_DISTANCE = 6
+
+
+def dhash(path, size=8):
+    """Difference hash of an image as a size*size bit integer"""
+    with Image.open(path) as img:
+        img = img.convert("L").resize((size + 1, size), Image.LANCZOS)
+        pixels = list(img.getdata())
+
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def image_file_path(image_path, clothes_dir=CLOTHES_DIR):
+    """Absolute path an image_path from the clothes table refers to, or None if it escapes clothes/"""
+    if not image_path:
+        return None
+    relative = image_path.replace("\\", "/").lstrip("/")
+    if relative.startswith("clothes/"):
+        relative = relative[len("clothes/"):]
+
+    path = os.path.abspath(os.path.join(clothes_dir, relative))
+    if not path.startswith(os.path.abspath(clothes_dir) + os.sep):
+        return None
+    return path
+
+
+def stored_forms(path, clothes_dir=CLOTHES_DIR):
+    """The spellings of image_path the clothes table uses for a file, for exact lookups"""
+    relative = os.path.relpath(path, os.path.abspath(clothes_dir)).replace(os.sep, "/")
+    forms = set()
+    for prefix in ("", "/", "clothes/", "/clothes/"):
+        forms.add(prefix + relative)
+        forms.add((prefix + relative).replace("/", "\\"))
+    return forms
+
+
+def resolve_image(image_path, clothes_dir=CLOTHES_DIR):
+    """Map an image_path as stored in the clothes table to an existing file on disk"""
+    path = image_file_path(image_path, clothes_dir)
+    return path if path and os.path.isfile(path) else None
+
+
+def iter_images(directory=CLOTHES_DIR):
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, filename)
+
+
+def _hash_file(path):
+    try:
+        return path, dhash(path)
+    except Exception as e:
+        print(f"Could not hash {path}: {e}")
+        return path, None
+
+
+class BKTree:
+    """Burkhard-Keller tree over hashes using hamming distance"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        node = [value, [item], {}]
+        if self.root is None:
+            self.root = node
+            self.size += 1
+            return
+
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            if distance == 0:
+                current[1].append(item)
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                self.size += 1
+                return
+            current = child
+
+    def search(self, value, max_distance):
+        """Return (distance, item) pairs within max_distance, closest first"""
+        if self.root is None:
+            return []
+
+        found = []
+        stack = [self.root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item) for item in items)
+            # Triangle inequality: only subtrees in this band can match
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+
+class ImageIndex:
+    def __init__(self, clothes_dir=CLOTHES_DIR):
+        self.clothes_dir = clothes_dir
+        self.tree = BKTree()
+        self.hashes = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Hash every image under the clothes directory"""
+        with self.lock:
+            if self.loaded:
+                return
+            for path in iter_images(self.clothes_dir):
+                self._add(*_hash_file(path))
+            self.loaded = True
+            print(f"Image index loaded: {len(self.hashes)} images")
+
+    def _add(self, path, value):
+        if value is None or path in self.hashes:
+            return
+        self.hashes[path] = value
+        self.tree.add(value, path)
+
+    def add(self, image_path):
+        path = resolve_image(image_path, self.clothes_dir)
+        if path:
+            self.load()
+            with self.lock:
+                self._add(*_hash_file(path))
+
+    def discard(self, image_path):
+        """Forget an image; the tree node stays, lookups skip it"""
+        path = resolve_image(image_path, self.clothes_dir) or image_path
+        with self.lock:
+            self.hashes.pop(path, None)
+
+    def matching_files(self, image_path, max_distance=DUPLICATE_DISTANCE):
+        """Files that look like image_path, the file itself included, as {path: distance}.
+
+        The index is keyed by file, so it can't tell which files are in use;
+        callers match these against clothes rows.
+        """
+        path = resolve_image(image_path, self.clothes_dir)
+        if not path:
+            return {}
+
+        self.load()
+        with self.lock:
+            value = self.hashes.get(path)
+            if value is None:
+                value = _hash_file(path)[1]
+                if value is None:
+                    return {path: 0}
+            matches = {other: distance for distance, other in self.tree.search(value, max_distance)
+                       if other in self.hashes}
+        matches[path] = 0
+        return matches
+
+
+_index = ImageIndex()
+
+
+def get_index():
+    return _index
+
+
+def dedupe_library(directory=CLOTHES_DIR, max_distance=DUPLICATE_DISTANCE, workers=None):
+    """Scan a whole image library and group near-duplicate images.
+
+    Hashing runs across a process pool; the grouping itself is cheap.
+    """
+    paths = list(iter_images(directory))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        hashed = [(p, h) for p, h in pool.map(_hash_file, paths, chunksize=16) if h is not None]
+
+    tree = BKTree()
+    for path, value in hashed:
+        tree.add(value, path)
+
+    seen = set()
+    groups = []
+    for path, value in hashed:
+        if path in seen:
+            continue
+        group = [other for _, other in tree.search(value, max_distance) if other not in seen]
+        seen.update(group)
+        if len(group) > 1:
+            groups.append(group)
+    return groups
+
+
+if __name__ == "__main__":
+    print(f"Scanning {CLOTHES_DIR} for duplicate images...")
+    duplicate_groups = dedupe_library()
+    for number, group in enumerate(duplicate_groups, 1):
+        print(f"\nGroup {number}:")
+        for image in group:
+            print(f"  {image}")
+    print(f"\nFound {len(duplicate_groups)} groups of duplicates")
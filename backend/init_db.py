@@ -18,6 +18,13 @@ def fix_database():
         else:
             print("Username column already exists.")
 
+        # Per-user wardrobe lookups filter on owner, body part and type
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_clothes_owner
+            ON clothes (username, body_part COLLATE NOCASE, type COLLATE NOCASE)
+        """)
+        print("Wardrobe owner index verified.")
+
         # Check current table structure
         print("\nCurrent clothes table structure:")
         cursor.execute("PRAGMA table_info(clothes)")
@@ -0,0 +1,277 @@
+# instrumentation.py - Opt-in SQL tracing, slow query log and sampled request profiling
+#
+# Everything here is off unless enabled through the environment:
+#   DRESSEZ_SQL_TRACE=1           time every statement and report per-request totals
+#   DRESSEZ_SLOW_QUERY_MS=100     statements slower than this go to the slow query log
+#   DRESSEZ_PROFILE_RATE=0.01     fraction of requests to profile
+#   DRESSEZ_PROFILE_HEADER=1      admins can force a profile with X-Profile: 1
+#
+# The slow query log records the types of bound parameters, never their
+# values, so emails and password hashes stay out of it.
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, request
+
+from pipeline import current_identity
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SQL_TRACE = os.environ.get("DRESSEZ_SQL_TRACE", "") == "1"
+SLOW_QUERY_MS = float(os.environ.get("DRESSEZ_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG = os.environ.get("DRESSEZ_SLOW_QUERY_LOG", os.path.join(BACKEND_DIR, "slow_queries.log"))
+PROFILE_RATE = float(os.environ.get("DRESSEZ_PROFILE_RATE", "0"))
+PROFILE_HEADER = os.environ.get("DRESSEZ_PROFILE_HEADER", "") == "1"
+PROFILE_DIR = os.environ.get("DRESSEZ_PROFILE_DIR", os.path.join(BACKEND_DIR, "profiles"))
+PROFILE_INTERVAL = 0.005
+
+_log_lock = threading.Lock()
+# Statement list a worker thread records into on behalf of a request
+_bound = threading.local()
+
+
+# -------------------- SQL TRACING --------------------
+def _statements():
+    """Statement records for the current request, or None outside of one"""
+    statements = getattr(_bound, "statements", None)
+    if statements is not None:
+        return statements
+    try:
+        return g.setdefault("sql_statements", [])
+    except RuntimeError:
+        return None
+
+
+def request_statements():
+    """The current request's statement list, to hand to worker threads; None when not tracing"""
+    return _statements() if SQL_TRACE else None
+
+
+@contextmanager
+def bind_statements(statements):
+    """Record statements run on this thread into a request's list (threads have no flask g)"""
+    previous = getattr(_bound, "statements", None)
+    _bound.statements = statements
+    try:
+        yield
+    finally:
+        _bound.statements = previous
+
+
+class TracingCursor(sqlite3.Cursor):
+    """Cursor that times statements and counts the rows they return"""
+
+    record = None
+
+    def _track(self, started, rows=0):
+        if self.record is not None:
+            self.record["ms"] += (time.perf_counter() - started) * 1000
+            self.record["rows"] += rows
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._start(sql, parameters, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._start(sql, None, started)
+
+    def _start(self, sql, parameters, started):
+        statements = _statements()
+        if statements is None:
+            self.record = None
+            return
+        is_query = self.description is not None
+        self.record = {
+            "sql": " ".join(sql.split()),
+            "params": list(parameters) if isinstance(parameters, (list, tuple)) else None,
+            "ms": 0.0,
+            "rows": 0 if is_query else max(self.rowcount, 0),
+            "db": self.connection.db_path
+        }
+        statements.append(self.record)
+        self._track(started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._track(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._track(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._track(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        self._track(started, 1)
+        return row
+
+
+class TracingConnection(sqlite3.Connection):
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.db_path = database
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(path, **kwargs):
+    """sqlite3.connect, traced when DRESSEZ_SQL_TRACE is on"""
+    if SQL_TRACE:
+        kwargs.setdefault("factory", TracingConnection)
+    return sqlite3.connect(path, **kwargs)
+
+
+def explain(db_path, sql, params):
+    """EXPLAIN QUERY PLAN on a separate connection, the original may be closed"""
+    if params is None or not sql.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE")):
+        return []
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    except sqlite3.Error as e:
+        return [f"explain failed: {e}"]
+    finally:
+        conn.close()
+
+
+def redact(params):
+    """Bound parameters as their type names, for logs"""
+    if params is None:
+        return None
+    return [type(value).__name__ for value in params]
+
+
+def log_slow_queries(statements, endpoint):
+    slow = [s for s in statements if s["ms"] >= SLOW_QUERY_MS]
+    if not slow:
+        return
+    lines = []
+    for statement in slow:
+        entry = dict(statement, endpoint=endpoint, at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        entry["plan"] = explain(statement["db"], statement["sql"], statement["params"])
+        entry["params"] = redact(statement["params"])
+        entry["ms"] = round(entry["ms"], 2)
+        lines.append(json.dumps(entry, default=str))
+    with _log_lock:
+        with open(SLOW_QUERY_LOG, "a", encoding="utf-8") as log:
+            log.write("\n".join(lines) + "\n")
+
+
+# -------------------- PROFILING --------------------
+class StackSampler:
+    """Samples one thread's stack on a timer and folds the samples for flamegraph.pl"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.items())
+
+
+def _should_profile():
+    if PROFILE_HEADER and request.headers.get("X-Profile") == "1" and current_identity().is_admin:
+        return True
+    return PROFILE_RATE > 0 and random.random() < PROFILE_RATE
+
+
+def _write_profile(sampler, endpoint):
+    if not sampler.samples:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint or 'unknown'}-{os.getpid()}.folded"
+    with open(os.path.join(PROFILE_DIR, filename), "w", encoding="utf-8") as out:
+        out.write(sampler.folded())
+
+
+# -------------------- FLASK HOOKS --------------------
+def init_app(app):
+    """Register the per-request tracing and profiling hooks"""
+
+    @app.before_request
+    def start_instrumentation():
+        g.request_started = time.perf_counter()
+        if _should_profile():
+            g.profiler = StackSampler(threading.get_ident())
+            g.profiler.start()
+
+    @app.after_request
+    def report_instrumentation(response):
+        statements = g.get("sql_statements")
+        if SQL_TRACE and statements is not None:
+            sql_ms = sum(s["ms"] for s in statements)
+            response.headers["X-SQL-Queries"] = str(len(statements))
+            response.headers["X-SQL-Time-Ms"] = f"{sql_ms:.2f}"
+            print(f"{request.method} {request.path}: {len(statements)} queries, "
+                  f"{sql_ms:.2f} ms in SQL, {(time.perf_counter() - g.request_started) * 1000:.2f} ms total")
+        return response
+
+    @app.teardown_request
+    def finish_instrumentation(exc=None):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.stop()
+            try:
+                _write_profile(profiler, request.endpoint)
+            except OSError as e:
+                print(f"Could not write profile: {e}")
+
+        statements = g.pop("sql_statements", None)
+        if statements:
+            try:
+                log_slow_queries(statements, request.endpoint)
+            except OSError as e:
+                print(f"Could not write slow query log: {e}")
@@ -2,71 +2,130 @@ from flask import Flask, send_from_directory, jsonify
 from flask_cors import CORS
 from auth import auth_blueprint
 from admin_routes import admin_routes
+import instrumentation
+import pipeline
+import cleanup
+import backup
+import warmup
+import similarity
+from image_index import CLOTHES_DIR
 import os
+import threading
 
 # Fix the React build path for your folder structure
 react_build_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../frontend/dist"))
 
-app = Flask(__name__, static_folder=react_build_path, static_url_path="")
-app.secret_key = os.environ.get("SECRET_KEY", "supersecretkey_donttellanyone")
-app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
-app.config["SESSION_COOKIE_HTTPONLY"] = True
-app.config["SESSION_COOKIE_SECURE"] = False
-
-# Enable CORS for all routes
-CORS(app, supports_credentials=True, resources={
-    r"/*": {
-        "origins": "*",
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
-    }
-})
-
-# Register blueprints
-app.register_blueprint(auth_blueprint, url_prefix="/auth")
-app.register_blueprint(admin_routes)
-
-# Serve clothing images
-@app.route('/clothes/<path:filename>')
-def serve_clothes(filename):
-    clothes_dir = os.path.join(app.root_path, 'clothes')
-    if not os.path.exists(clothes_dir):
-        os.makedirs(clothes_dir)
-        for subdir in ['tops', 'bottoms', 'shoes']:
-            subdir_path = os.path.join(clothes_dir, subdir)
-            if not os.path.exists(subdir_path):
-                os.makedirs(subdir_path)
-    
-    try:
-        return send_from_directory(clothes_dir, filename)
-    except FileNotFoundError:
-        return jsonify({"error": "Image not found"}), 404
-
-# Health check endpoint
-@app.route('/health')
-def health_check():
-    return jsonify({"status": "healthy", "message": "DressEZ is running!"})
-
-# Serve React app for all other routes
-@app.route("/", defaults={"path": ""})
-@app.route("/<path:path>")
-def serve(path):
-    # Handle specific React routes
-    react_routes = [
-        'login', 'register', 'admin-dashboard', 'user-dashboard', 
-        'filter', 'pick', 'settings', 'add-clothes',
-        'admin/users', 'admin/content', 'admin/data-entry', 'admin/analytics'
-    ]
-    
-    if path in react_routes:
+# Cleanup, backups and vector rebuilds run on daemon threads. `python main.py`
+# starts them; under gunicorn and other multi-process servers every worker
+# would, so there they are opt-in: set DRESSEZ_BACKGROUND_WORKERS=1 for one
+# process, or run cleanup.py / backup.py / similarity.py from cron.
+BACKGROUND_WORKERS = os.environ.get("DRESSEZ_BACKGROUND_WORKERS", "") == "1"
+_workers_started = False
+_workers_lock = threading.Lock()
+
+
+def start_background_workers():
+    """Start the cleanup, backup and vector workers, once per process"""
+    global _workers_started
+    with _workers_lock:
+        if _workers_started:
+            return False
+        _workers_started = True
+
+    # Periodically remove rows and images left behind by deleted users
+    cleanup.start_worker()
+
+    # Scheduled online snapshots of every database (see backup.py)
+    backup.start_worker()
+
+    # Fold newly added items into the similarity matrix (see similarity.py)
+    similarity.start_worker()
+    return True
+
+
+def create_app(warmup_mode=warmup.WARMUP_MODE):
+    app = Flask(__name__, static_folder=react_build_path, static_url_path="")
+    app.secret_key = os.environ.get("SECRET_KEY", "supersecretkey_donttellanyone")
+    app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+    app.config["SESSION_COOKIE_HTTPONLY"] = True
+    app.config["SESSION_COOKIE_SECURE"] = False
+
+    # Enable CORS for all routes
+    CORS(app, supports_credentials=True, resources={
+        r"/*": {
+            "origins": "*",
+            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization"],
+            "max_age": pipeline.PREFLIGHT_MAX_AGE
+        }
+    })
+
+    # Preflights are answered before routing; the session is read once per request
+    pipeline.init_app(app)
+
+    # Opt-in SQL tracing and request profiling (see instrumentation.py)
+    instrumentation.init_app(app)
+
+    # Register blueprints
+    app.register_blueprint(auth_blueprint, url_prefix="/auth")
+    app.register_blueprint(admin_routes)
+
+    # Serve clothing images; warmup creates the directories
+    @app.route('/clothes/<path:filename>')
+    def serve_clothes(filename):
+        try:
+            return send_from_directory(CLOTHES_DIR, filename)
+        except FileNotFoundError:
+            return jsonify({"error": "Image not found"}), 404
+
+    # Health check endpoint
+    @app.route('/health')
+    def health_check():
+        return jsonify({"status": "healthy", "message": "DressEZ is running!"})
+
+    # Readiness: 503 until the warmup stages have run cleanly, for load balancers and rollouts
+    @app.route('/health/ready')
+    def readiness_check():
+        report = warmup.warmup_report()
+        if report["ready"]:
+            status = "ready"
+        elif report["finished"]:
+            status = "degraded"
+        else:
+            status = "warming"
+        return jsonify({"status": status, **report}), 200 if report["ready"] else 503
+
+    # Serve React app for all other routes
+    @app.route("/", defaults={"path": ""})
+    @app.route("/<path:path>")
+    def serve(path):
+        # Handle specific React routes
+        react_routes = [
+            'login', 'register', 'admin-dashboard', 'user-dashboard',
+            'filter', 'pick', 'settings', 'add-clothes',
+            'admin/users', 'admin/content', 'admin/data-entry', 'admin/analytics'
+        ]
+
+        if path in react_routes:
+            return send_from_directory(app.static_folder, "index.html")
+
+        # For other paths, try to serve the actual file first
+        if path != "" and warmup.static_file_exists(app.static_folder, path):
+            return send_from_directory(app.static_folder, path)
+
+        # Default to React app
         return send_from_directory(app.static_folder, "index.html")
-    
-    # For other paths, try to serve the actual file first
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    
-    # Default to React app
-    return send_from_directory(app.static_folder, "index.html")
+
+    # Schema, database files, image index, vectors and the static manifest
+    warmup.start_warmup(app, warmup_mode)
+    return app
+
+
+app = create_app()
+
+# Run as a script, the block below decides
+if BACKGROUND_WORKERS and __name__ != "__main__":
+    start_background_workers()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -77,5 +136,10 @@ if __name__ == "__main__":
     print(f"Port: {port}")
     print(f"Debug mode: {debug}")
     print(f"Static folder exists: {os.path.exists(react_build_path)}")
-    
+
+    # With the debug reloader this process only watches files and the server
+    # runs in a child started with WERKZEUG_RUN_MAIN set; only that one runs workers
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_workers()
+
     app.run(host='0.0.0.0', port=port, debug=debug)
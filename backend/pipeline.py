@@ -0,0 +1,68 @@
+# pipeline.py - Request handling shared by every blueprint
+#
+# CORS preflights are answered before any view or auth check runs, and the
+# session identity is resolved once per request into g.identity, which the
+# admin_required/login_required decorators and the views all read.
+import os
+from functools import wraps
+
+from flask import g, jsonify, request, session
+
+# How long browsers may cache a preflight answer, in seconds
+PREFLIGHT_MAX_AGE = int(os.environ.get("DRESSEZ_CORS_MAX_AGE", "86400"))
+
+
+class Identity:
+    """Who is making the request, as read from the session cookie"""
+
+    __slots__ = ("username", "role")
+
+    def __init__(self, username=None, role=None):
+        self.username = username
+        self.role = role
+
+    @property
+    def authenticated(self):
+        return self.username is not None
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+
+def current_identity():
+    """The request's identity, read from the session on first use"""
+    identity = g.get("identity")
+    if identity is None:
+        identity = g.identity = Identity(session.get("username"), session.get("role"))
+    return identity
+
+
+def admin_required(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not current_identity().is_admin:
+            return jsonify({"error": "Admin access required"}), 403
+        return f(*args, **kwargs)
+
+    return wrapper
+
+
+def login_required(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not current_identity().authenticated:
+            return jsonify({"error": "Login required"}), 401
+        return f(*args, **kwargs)
+
+    return wrapper
+
+
+def init_app(app):
+    """Register the pipeline hooks; call before any other before_request hooks"""
+
+    @app.before_request
+    def answer_preflight():
+        # flask-cors adds the Access-Control-* headers to this response in after_request
+        if request.method == "OPTIONS":
+            return app.make_default_options_response()
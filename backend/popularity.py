@@ -0,0 +1,100 @@
+# popularity.py - Per-item wear counters kept up to date as outfits are saved
+from storage import database_file
+
+# /filter?sort=... names and the item_stats column each one orders by
+SORT_ORDERS = {
+    "popular": "wear_count",
+    "recent": "last_worn_at"
+}
+ITEM_COLUMNS = "clothes.id, clothes.name, clothes.type, clothes.body_part, clothes.image_path"
+
+# Database files already known to have item_stats
+_stats_tables = set()
+
+
+def ensure_stats_table(conn):
+    """Create item_stats and its indexes. The counters carry their item's
+    owner and body part, so a wardrobe's sorted counters are one index range.
+
+    Counters from before those columns existed are filled in from clothes;
+    no commit here, the caller's transaction or commit() keeps it.
+    """
+    path = database_file(conn)
+    if path in _stats_tables:
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_stats (
+            item_id INTEGER PRIMARY KEY,
+            username TEXT,
+            body_part TEXT,
+            wear_count INTEGER NOT NULL DEFAULT 0,
+            last_worn_at TIMESTAMP
+        )
+    """)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(item_stats)")}
+    if "body_part" not in columns:
+        conn.execute("ALTER TABLE item_stats ADD COLUMN username TEXT")
+        conn.execute("ALTER TABLE item_stats ADD COLUMN body_part TEXT")
+        conn.execute("""
+            UPDATE item_stats SET
+                username = (SELECT username FROM clothes WHERE clothes.id = item_stats.item_id),
+                body_part = (SELECT body_part FROM clothes WHERE clothes.id = item_stats.item_id)
+        """)
+    # Whole-shard sorts walk these
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_stats_popular ON item_stats (wear_count DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_stats_recent ON item_stats (last_worn_at DESC)")
+    # One wardrobe's sorts, optionally for one body part, walk these
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_item_stats_owner_popular
+        ON item_stats (username, body_part COLLATE NOCASE, wear_count DESC)""")
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_item_stats_owner_recent
+        ON item_stats (username, body_part COLLATE NOCASE, last_worn_at DESC)""")
+    _stats_tables.add(path)
+
+
+def record_wear(conn, item_ids):
+    """Count one wear for each item with a clothes row on this connection's shard.
+
+    Call inside the outfit's write transaction; returns the ids that were counted.
+    """
+    ensure_stats_table(conn)
+    counted = []
+    for item_id in item_ids:
+        cursor = conn.execute("""
+            INSERT INTO item_stats (item_id, username, body_part, wear_count, last_worn_at)
+            SELECT id, username, body_part, 1, CURRENT_TIMESTAMP FROM clothes WHERE id = ?
+            ON CONFLICT(item_id) DO UPDATE SET
+                wear_count = wear_count + 1,
+                last_worn_at = CURRENT_TIMESTAMP
+        """, (item_id,))
+        if cursor.rowcount:
+            counted.append(item_id)
+    return counted
+
+
+def sorted_queries(where, params, sort):
+    """Queries whose results, run in order and concatenated, are the matching items ordered by sort.
+
+    where names the username and body_part columns as {t}.username and
+    {t}.body_part. Worn items come first and are read from item_stats, so
+    a wardrobe filter is a range of its owner index and the whole shard
+    walks the sort index; items never worn follow by name.
+    """
+    column = SORT_ORDERS[sort]
+    worn = (f"SELECT {ITEM_COLUMNS}, s.wear_count, s.last_worn_at "
+            f"FROM item_stats s CROSS JOIN clothes ON clothes.id = s.item_id "
+            f"WHERE {where.format(t='s')} ORDER BY s.{column} DESC, s.item_id")
+    never_worn = (f"SELECT {ITEM_COLUMNS}, 0 AS wear_count, NULL AS last_worn_at FROM clothes "
+                  f"WHERE NOT EXISTS (SELECT 1 FROM item_stats s WHERE s.item_id = clothes.id) "
+                  f"AND {where.format(t='clothes')} ORDER BY clothes.name")
+    return [(worn, params), (never_worn, params)]
+
+
+def sort_rows(rows, sort):
+    """Order rows gathered from several shards the way sorted_queries orders one"""
+    if sort not in SORT_ORDERS:
+        return sorted(rows, key=lambda row: row["name"])
+    column = SORT_ORDERS[sort]
+    worn = sorted((row for row in rows if row[column]), key=lambda row: row["id"])
+    worn.sort(key=lambda row: row[column], reverse=True)
+    never_worn = sorted((row for row in rows if not row[column]), key=lambda row: row["name"])
+    return worn + never_worn
@@ -32,6 +32,10 @@ def init_database():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_clothes_owner
+        ON clothes (username, body_part COLLATE NOCASE, type COLLATE NOCASE)
+    """)
     
     # Create outfits table
     cursor.execute("""
@@ -0,0 +1,115 @@
+# post_search.py - FTS5 index over moderation posts
+import html
+import re
+
+# Column weights for bm25(): title matches count most, then author, then body
+BM25_WEIGHTS = (10.0, 1.0, 2.0)
+MAX_PER_PAGE = 100
+# FTS5 marks matches with these control characters; the text around them is
+# HTML-escaped and only then are they turned into <mark> tags
+MARK_START, MARK_END = "\x02", "\x03"
+
+_fts_ready = False
+
+
+def ensure_posts_fts(conn):
+    """Create the posts_fts index and its sync triggers; False if there are no posts yet"""
+    global _fts_ready
+    if _fts_ready:
+        return True
+
+    tables = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name IN ('posts', 'posts_fts')"
+    ).fetchall()}
+    if "posts" not in tables:
+        return False
+
+    # External content table: the text lives in posts, the index only stores tokens
+    conn.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+            title, body, author,
+            content='posts', content_rowid='id'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+            INSERT INTO posts_fts (rowid, title, body, author)
+            VALUES (new.id, new.title, new.body, new.author);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, title, body, author)
+            VALUES ('delete', old.id, old.title, old.body, old.author);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE ON posts BEGIN
+            INSERT INTO posts_fts (posts_fts, rowid, title, body, author)
+            VALUES ('delete', old.id, old.title, old.body, old.author);
+            INSERT INTO posts_fts (rowid, title, body, author)
+            VALUES (new.id, new.title, new.body, new.author);
+        END;
+    """)
+    if "posts_fts" not in tables:
+        # Index the posts that were written before the triggers existed
+        conn.execute("INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')")
+    conn.commit()
+
+    _fts_ready = True
+    return True
+
+
+def match_query(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    words = re.findall(r"\w+", text, re.UNICODE)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def marked_html(text):
+    """HTML-escape highlight()/snippet() output and turn its match markers into <mark> tags"""
+    if text is None:
+        return None
+    return html.escape(text).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def search_posts(conn, text, page=1, per_page=20, status=None):
+    """BM25-ranked page of posts matching text, with highlighted title and body snippet"""
+    query = match_query(text)
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    page = max(page, 1)
+    empty = {"results": [], "total": 0, "page": page, "per_page": per_page}
+    if not query or not ensure_posts_fts(conn):
+        return empty
+
+    where = "posts_fts MATCH ?"
+    params = [query]
+    if status:
+        where += " AND p.status = ?"
+        params.append(status)
+
+    total = conn.execute(
+        f"SELECT COUNT(*) FROM posts_fts JOIN posts p ON p.id = posts_fts.rowid WHERE {where}", params
+    ).fetchone()[0]
+    if total == 0:
+        return empty
+
+    rows = conn.execute(f"""
+        SELECT p.id, p.title, p.body, p.author, p.status, p.created_at,
+               highlight(posts_fts, 0, ?, ?) AS title_highlight,
+               snippet(posts_fts, 1, ?, ?, '...', 16) AS snippet,
+               bm25(posts_fts, ?, ?, ?) AS rank
+        FROM posts_fts JOIN posts p ON p.id = posts_fts.rowid
+        WHERE {where}
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    """, [MARK_START, MARK_END, MARK_START, MARK_END, *BM25_WEIGHTS, *params,
+          per_page, (page - 1) * per_page]).fetchall()
+
+    results = []
+    for row in rows:
+        result = dict(row)
+        result["rank"] = round(result["rank"], 6)
+        # Titles and bodies are user text: the highlights are safe to render as HTML
+        result["title_highlight"] = marked_html(result["title_highlight"])
+        result["snippet"] = marked_html(result["snippet"])
+        results.append(result)
+
+    return {"results": results, "total": total, "page": page, "per_page": per_page}
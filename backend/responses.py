@@ -0,0 +1,89 @@
+import gzip
+import json
+
+from flask import request, Response
+
+# Optional fast encoder / compressor, used when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Don't bother compressing tiny payloads, the headers cost more than we save
+COMPRESS_MIN_BYTES = 1024
+
+
+def dumps(data):
+    """Serialize data to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def to_columns(rows, prefixes=None):
+    """Turn a list of dicts into a column-oriented dict.
+
+    Keys in `prefixes` have their shared prefix stripped from every value,
+    the client adds it back from the "prefixes" field.
+    """
+    prefixes = prefixes or {}
+    names = list(rows[0].keys()) if rows else []
+    columns = {key: [] for key in names}
+
+    for row in rows:
+        for key in names:
+            value = row.get(key)
+            prefix = prefixes.get(key)
+            if prefix and isinstance(value, str) and value.startswith(prefix):
+                value = value[len(prefix):]
+            columns[key].append(value)
+
+    return {
+        "count": len(rows),
+        "prefixes": {k: v for k, v in prefixes.items() if k in columns},
+        "columns": columns
+    }
+
+
+def _pick_encoding():
+    """Highest-q encoding we can produce; q=0 refuses one, ties go to br"""
+    # werkzeug parses the q-values and matches exact tokens before "*"
+    accepted = request.accept_encodings
+    best, best_q = None, 0
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        quality = accepted[encoding]
+        if quality > best_q:
+            best, best_q = encoding, quality
+    return best
+
+
+def json_response(data, status=200, prefixes=None):
+    """Build a compact, optionally compressed JSON response.
+
+    List payloads are returned column-oriented when the request has
+    `?format=columns`.
+    """
+    if isinstance(data, list) and request.args.get("format") == "columns":
+        data = to_columns(data, prefixes)
+
+    body = dumps(data)
+    response = Response(body, status=status, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = _pick_encoding()
+        if encoding == "br":
+            response.set_data(brotli.compress(body, quality=4))
+        elif encoding == "gzip":
+            response.set_data(gzip.compress(body, compresslevel=5))
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+
+    return response
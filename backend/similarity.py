@@ -0,0 +1,326 @@
+# similarity.py - Colour feature vectors and nearest-neighbour search for clothes
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from image_index import resolve_image
+from instrumentation import connect
+from storage import CORE_DB, all_shards, process_lock, scatter
+
+FEATURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "features")
+VECTORS_FILE = os.path.join(FEATURES_DIR, "clothes_vectors.npy")
+IDS_FILE = os.path.join(FEATURES_DIR, "clothes_ids.npy")
+
+# 4 bins per RGB channel -> 64 dimensional colour histogram
+BINS = 4
+DIMENSIONS = BINS ** 3
+# Rows scored per matrix-vector product, keeps the working set in cache
+BATCH_ROWS = 65536
+# Seconds between scheduled rebuilds of the feature matrix, 0 disables the worker
+REBUILD_INTERVAL = int(os.environ.get("DRESSEZ_VECTOR_REBUILD_INTERVAL", "86400"))
+
+_log_ready = False
+
+
+def ensure_feature_log(conn):
+    """Vectors of items added since the last build, shared by every worker"""
+    global _log_ready
+    if _log_ready:
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS feature_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            vector BLOB NOT NULL
+        )
+    """)
+    conn.commit()
+    _log_ready = True
+
+
+def extract_features(path):
+    """L2-normalised RGB colour histogram of an image"""
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        img.thumbnail((64, 64))
+        pixels = np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+
+    quantised = pixels // (256 // BINS)
+    codes = (quantised[:, 0].astype(np.int32) * BINS + quantised[:, 1]) * BINS + quantised[:, 2]
+    histogram = np.bincount(codes, minlength=DIMENSIONS).astype(np.float32)
+
+    norm = np.linalg.norm(histogram)
+    return histogram / norm if norm else histogram
+
+
+def score_rows(vectors, query):
+    """Cosine score of every row against query"""
+    scores = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), BATCH_ROWS):
+        end = min(start + BATCH_ROWS, len(vectors))
+        np.dot(vectors[start:end], query, out=scores[start:end])
+    return scores
+
+
+def top_k(scores, k):
+    """Indices of the k highest finite scores, best first"""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return best[np.isfinite(scores[best])]
+
+
+class VectorStore:
+    """Memory-mapped feature matrix plus vectors added since the last build.
+
+    Added vectors go to the feature_log table, so other workers and restarts
+    see them; a build folds them into the matrix and trims the log.
+    """
+
+    def __init__(self, vectors_file=VECTORS_FILE, ids_file=IDS_FILE):
+        self.vectors_file = vectors_file
+        self.ids_file = ids_file
+        self.vectors = np.empty((0, DIMENSIONS), dtype=np.float32)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.positions = {}
+        self.pending = {}
+        self.log_seq = 0
+        self.stamp = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.ids_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_ino
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            self.stamp = self._file_stamp()
+            if os.path.exists(self.vectors_file) and os.path.exists(self.ids_file):
+                try:
+                    self.vectors = np.load(self.vectors_file, mmap_mode="r")
+                except ValueError:
+                    # numpy refuses to map an array with no rows
+                    self.vectors = np.load(self.vectors_file)
+                self.ids = np.load(self.ids_file)
+                if len(self.vectors) != len(self.ids):
+                    # Caught between a build's two swaps; the next refresh retries
+                    self.vectors = np.empty((0, DIMENSIONS), dtype=np.float32)
+                    self.ids = np.empty(0, dtype=np.int64)
+                    self.stamp = None
+                self.positions = {int(item_id): pos for pos, item_id in enumerate(self.ids)}
+                print(f"Loaded {len(self.ids)} clothing feature vectors")
+            self.loaded = True
+
+    def reload(self):
+        with self.lock:
+            self.pending = {}
+            self.log_seq = 0
+            self.loaded = False
+        self.load()
+
+    def refresh(self):
+        """Pick up a rebuilt matrix and vectors other workers have logged"""
+        self.load()
+        if self._file_stamp() != self.stamp:
+            self.reload()
+
+        conn = connect(CORE_DB)
+        try:
+            ensure_feature_log(conn)
+            rows = conn.execute(
+                "SELECT seq, item_id, vector FROM feature_log WHERE seq > ? ORDER BY seq", (self.log_seq,)
+            ).fetchall()
+        finally:
+            conn.close()
+        if rows:
+            with self.lock:
+                for seq, item_id, vector in rows:
+                    self.pending[item_id] = np.frombuffer(vector, dtype=np.float32)
+                    self.log_seq = max(self.log_seq, seq)
+
+    def add(self, item_id, image_path):
+        """Index a newly added item until the next full build"""
+        path = resolve_image(image_path)
+        if not path:
+            return
+        try:
+            vector = extract_features(path)
+        except Exception as e:
+            print(f"Could not extract features for {image_path}: {e}")
+            return
+
+        conn = connect(CORE_DB)
+        try:
+            ensure_feature_log(conn)
+            conn.execute("INSERT INTO feature_log (item_id, vector) VALUES (?, ?)",
+                         (int(item_id), vector.astype(np.float32).tobytes()))
+            conn.commit()
+        finally:
+            conn.close()
+        with self.lock:
+            self.pending[int(item_id)] = vector
+
+    def _snapshot(self):
+        """Matrix, ids, positions and pending vectors from one load; load() swaps them one by one"""
+        self.refresh()
+        with self.lock:
+            return self.vectors, self.ids, self.positions, dict(self.pending)
+
+    def vector_for(self, item_id):
+        vectors, _, positions, pending = self._snapshot()
+        if item_id in pending:
+            return pending[item_id]
+        position = positions.get(item_id)
+        return None if position is None else np.asarray(vectors[position])
+
+    def ranking(self, item_id):
+        """Score every item against item_id once. Returns top(n), giving the
+        (item_id, score) pairs of the n closest items, or None when item_id
+        has no features."""
+        vectors, ids, positions, pending = self._snapshot()
+        if item_id in pending:
+            query = pending[item_id]
+        elif item_id in positions:
+            query = np.asarray(vectors[positions[item_id]])
+        else:
+            return None
+
+        scores = score_rows(vectors, query)
+        if item_id in positions:
+            scores[positions[item_id]] = -np.inf
+        added = sorted(
+            ((other_id, float(np.dot(vector, query))) for other_id, vector in pending.items()
+             if other_id != item_id and other_id not in positions),
+            key=lambda pair: pair[1], reverse=True
+        )
+
+        def top(n):
+            results = [(int(ids[i]), float(scores[i])) for i in top_k(scores, n)] + added[:n]
+            results.sort(key=lambda pair: pair[1], reverse=True)
+            return results[:n]
+
+        return top
+
+    def similar(self, item_id, k=10):
+        """(item_id, score) pairs for the k items closest to item_id"""
+        top = self.ranking(item_id)
+        return None if top is None else top(k)
+
+
+def _save_temp(array, target):
+    """Write array to a uniquely named file next to target, returns its path"""
+    fd, path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp.npy")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def build(vectors_file=VECTORS_FILE, ids_file=IDS_FILE):
+    """Extract features for every clothing item on every shard and write them
+    to disk. Returns how many, or None if another process is already building."""
+    # One builder per host, so worker processes never write the files at once
+    with process_lock(vectors_file + ".lock") as locked:
+        if not locked:
+            return None
+        return _build(vectors_file, ids_file)
+
+
+def _build(vectors_file, ids_file):
+    def item_images(conn, index):
+        return conn.execute("SELECT id, image_path FROM clothes ORDER BY id").fetchall()
+
+    # Logged vectors up to here belong to items the scan below will see
+    conn = connect(CORE_DB)
+    try:
+        ensure_feature_log(conn)
+        logged_up_to = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM feature_log").fetchone()[0]
+    finally:
+        conn.close()
+
+    rows = [tuple(row) for shard_rows in scatter(all_shards(), item_images) for row in shard_rows]
+
+    vectors = np.empty((len(rows), DIMENSIONS), dtype=np.float32)
+    ids = []
+    for item_id, image_path in rows:
+        path = resolve_image(image_path)
+        if not path:
+            continue
+        try:
+            vectors[len(ids)] = extract_features(path)
+        except Exception as e:
+            print(f"Skipping item {item_id}: {e}")
+            continue
+        ids.append(item_id)
+
+    # Write next to the live files and swap, running servers keep their old mapping.
+    # Readers reload when the ids file changes, so it goes in last.
+    tmp_vectors = _save_temp(vectors[:len(ids)], vectors_file)
+    try:
+        tmp_ids = _save_temp(np.asarray(ids, dtype=np.int64), ids_file)
+    except BaseException:
+        os.remove(tmp_vectors)
+        raise
+    os.replace(tmp_vectors, vectors_file)
+    os.replace(tmp_ids, ids_file)
+
+    conn = connect(CORE_DB)
+    try:
+        conn.execute("DELETE FROM feature_log WHERE seq <= ?", (logged_up_to,))
+        conn.commit()
+    finally:
+        conn.close()
+    return len(ids)
+
+
+_store = VectorStore()
+
+
+def get_store():
+    return _store
+
+
+def start_worker(interval=REBUILD_INTERVAL):
+    """Rebuild the feature matrix every `interval` seconds on a daemon thread"""
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                count = build()
+                if count is None:
+                    print("Feature vector rebuild skipped, another process is building")
+                else:
+                    print(f"Rebuilt {count} clothing feature vectors")
+            except Exception as e:
+                print(f"Feature vector rebuild failed: {e}")
+
+    worker = threading.Thread(target=loop, name="vector-worker", daemon=True)
+    worker.start()
+    return worker
+
+
+if __name__ == "__main__":
+    print("Extracting clothing feature vectors...")
+    count = build()
+    if count is None:
+        print("Another process is already building the vectors")
+    else:
+        print(f"Wrote {count} vectors to {VECTORS_FILE}")
@@ -0,0 +1,297 @@
+# storage.py - Routes user-owned tables to SQLite shards
+#
+# users and posts stay in the core database. clothes, outfits and the
+# per-item wear counters are partitioned by owner across DRESSEZ_SHARDS
+# files, so writes from different users don't queue on one writer lock.
+# With the default of one shard, shard 0 is the core database itself.
+#
+# Every shard hands out AUTOINCREMENT ids from its own range
+# (shard << ID_SHIFT), so an item id alone says which shard holds it.
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from instrumentation import bind_statements, connect, request_statements
+
+CORE_DB = "database.db"
+SHARD_COUNT = max(int(os.environ.get("DRESSEZ_SHARDS", "1")), 1)
+SHARD_DIR = os.environ.get("DRESSEZ_SHARD_DIR", "shards")
+ID_SHIFT = 40
+# Items with no owner (the shared catalog) and anonymous items live here
+CATALOG_SHARD = 0
+MIGRATE_BATCH = 500
+
+SHARD_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS clothes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        body_part TEXT NOT NULL,
+        image_path TEXT NOT NULL,
+        username TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_clothes_owner
+        ON clothes (username, body_part COLLATE NOCASE, type COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_clothes_image ON clothes (image_path);
+
+    CREATE TABLE IF NOT EXISTS outfits (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        top_name TEXT,
+        bottom_name TEXT,
+        shoes_name TEXT,
+        saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_outfits_username ON outfits (username);
+"""
+
+# Shard files whose schema has been checked by this process
+_ready_shards = set()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def shard_path(index):
+    if index == 0:
+        return CORE_DB
+    return os.path.join(SHARD_DIR, f"shard_{index}.db")
+
+
+def database_file(conn):
+    """Path of the connection's main database, for per-file setup flags"""
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+def shard_for(username, shard_count=SHARD_COUNT):
+    """Shard holding a user's rows; crc32 so every process agrees"""
+    if not username or username == "anonymous":
+        return CATALOG_SHARD
+    return zlib.crc32(username.encode("utf-8")) % shard_count
+
+
+def shard_of_id(item_id):
+    return item_id >> ID_SHIFT
+
+
+def valid_item_id(item_id, shard_count=SHARD_COUNT):
+    """Whether a client-supplied id is an int that falls in an existing shard's range"""
+    if not isinstance(item_id, int) or isinstance(item_id, bool) or item_id <= 0:
+        return False
+    return shard_of_id(item_id) < shard_count
+
+
+def ensure_shard(conn, index):
+    """Create the shard's tables and start its id sequences in the shard's range"""
+    # WAL lets readers, including online backups, run without blocking writers
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SHARD_SCHEMA)
+    for table in ("clothes", "outfits"):
+        conn.execute("""
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+        """, (table, index << ID_SHIFT, table))
+    conn.commit()
+
+
+def connect_shard(index, shard_count=SHARD_COUNT):
+    """Connection to one shard. Core tables are not attached: a write
+    transaction would then lock database.db as well."""
+    # Never create a file for a shard that doesn't exist
+    if not 0 <= index < shard_count:
+        raise ValueError(f"No shard {index}, there are {shard_count}")
+    path = shard_path(index)
+    if path != CORE_DB:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = connect(path)
+    conn.row_factory = sqlite3.Row
+
+    if path not in _ready_shards:
+        ensure_shard(conn, index)
+        _ready_shards.add(path)
+    return conn
+
+
+def connect_user(username):
+    return connect_shard(shard_for(username))
+
+
+def connect_item(item_id):
+    return connect_shard(shard_of_id(item_id))
+
+
+def user_shards(username, include_catalog=False):
+    shards = {shard_for(username)}
+    if include_catalog:
+        shards.add(CATALOG_SHARD)
+    return sorted(shards)
+
+
+def all_shards():
+    return list(range(SHARD_COUNT))
+
+
+@contextmanager
+def process_lock(path):
+    """Non-blocking lock on a file, shared by every process on the host.
+    Yields whether it was taken; the lock goes when the block exits."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    f = open(path, "a+")
+    try:
+        try:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if not fcntl:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        f.close()
+
+
+def scatter(shards, work):
+    """Run work(conn, index) against each shard, in parallel when there are several"""
+    # Pool threads have no flask g, so hand them the request's SQL trace
+    statements = request_statements()
+
+    def run(index):
+        with bind_statements(statements):
+            conn = connect_shard(index)
+            try:
+                return work(conn, index)
+            finally:
+                conn.close()
+
+    if len(shards) == 1:
+        return [run(shards[0])]
+    return list(_shard_pool().map(run, shards))
+
+
+def _shard_pool():
+    """The thread pool scatter() uses, created on first need; the lock
+    stops concurrent first requests from each building one"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard")
+        return _pool
+
+
+# -------------------- MIGRATION --------------------
+def _move_rows(source, target, table, rows):
+    columns = [key for key in rows[0].keys() if key != "id"]
+    placeholders = ",".join("?" * len(columns))
+    moved = {}
+    for row in rows:
+        cursor = target.execute(
+            f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})",
+            [row[column] for column in columns]
+        )
+        moved[row["id"]] = cursor.lastrowid
+    source.executemany(f"DELETE FROM {table} WHERE id = ?", [(old_id,) for old_id in moved])
+    return moved
+
+
+def _move_item_stats(source, target, moved):
+    exists = source.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='item_stats'").fetchone()
+    if not exists:
+        return
+    from popularity import ensure_stats_table
+    ensure_stats_table(target)
+    for old_id, new_id in moved.items():
+        stats = source.execute("SELECT wear_count, last_worn_at FROM item_stats WHERE item_id = ?", (old_id,)).fetchone()
+        if stats:
+            # Owner and body part come from the item's new clothes row
+            target.execute("""
+                INSERT OR REPLACE INTO item_stats (item_id, username, body_part, wear_count, last_worn_at)
+                SELECT id, username, body_part, ?, ? FROM clothes WHERE id = ?
+            """, (stats[0], stats[1], new_id))
+            source.execute("DELETE FROM item_stats WHERE item_id = ?", (old_id,))
+
+
+def rebalance(shard_count=SHARD_COUNT, previous_count=None):
+    """Move every row to the shard its owner hashes to under shard_count.
+
+    Run after changing DRESSEZ_SHARDS, with previous_count the old value.
+    Moved clothes get new ids in their new shard's range; rebuild the
+    similarity vectors afterwards.
+    """
+    from cache import bump_version
+
+    previous_count = previous_count or shard_count
+    sources = range(max(shard_count, previous_count))
+    report = {"clothes": 0, "outfits": 0}
+
+    for source_index in sources:
+        path = shard_path(source_index)
+        if not os.path.exists(path):
+            continue
+        for table in ("clothes", "outfits"):
+            last_id = 0
+            while True:
+                source = connect(path)
+                source.row_factory = sqlite3.Row
+                try:
+                    tables = {r[0] for r in source.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+                    if table not in tables:
+                        break
+                    rows = source.execute(
+                        f"SELECT * FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, MIGRATE_BATCH)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    last_id = rows[-1]["id"]
+
+                    by_target = {}
+                    for row in rows:
+                        target_index = shard_for(row["username"], shard_count)
+                        if shard_path(target_index) != path:
+                            by_target.setdefault(target_index, []).append(row)
+
+                    for target_index, moving in by_target.items():
+                        target = connect_shard(target_index, shard_count)
+                        try:
+                            # Copy, commit the target, then delete from the source:
+                            # a crash in between leaves a duplicate, never a loss
+                            moved = _move_rows(source, target, table, moving)
+                            if table == "clothes":
+                                _move_item_stats(source, target, moved)
+                            bump_version(target, table)
+                            target.commit()
+                        finally:
+                            target.close()
+                        bump_version(source, table)
+                        source.commit()
+                        report[table] += len(moving)
+                finally:
+                    source.close()
+
+    print(f"Rebalanced {report['clothes']} clothes and {report['outfits']} outfits across {shard_count} shards")
+    return report
+
+
+if __name__ == "__main__":
+    # python storage.py rebalance [previous_shard_count]
+    if len(sys.argv) >= 2 and sys.argv[1] == "rebalance":
+        rebalance(SHARD_COUNT, int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    else:
+        print("usage: DRESSEZ_SHARDS=N python storage.py rebalance [previous_shard_count]")
@@ -0,0 +1,178 @@
+# warmup.py - Startup work done once per worker before it reports ready
+#
+# Without this a new worker pays for schema checks, cold database files,
+# the image hash index and the feature matrix on its first requests.
+# Each stage is timed; /health/ready answers 503 until every stage ran
+# without errors, and keeps answering 503 (degraded) if one failed.
+import os
+import threading
+import time
+
+import post_search
+from cache import ensure_version_table
+from events import ensure_events_table
+from image_index import CLOTHES_DIR, get_index
+from instrumentation import connect
+from popularity import ensure_stats_table
+from similarity import get_store
+from storage import CORE_DB, all_shards, connect_shard, shard_path
+
+# background: serve while warming, sync: warm before create_app returns, off: skip
+WARMUP_MODE = os.environ.get("DRESSEZ_WARMUP", "background")
+CLOTHES_SUBDIRS = ("tops", "bottoms", "shoes")
+# Bytes of each database file read ahead into the OS page cache
+WARM_DB_BYTES = int(os.environ.get("DRESSEZ_WARM_DB_MB", "256")) * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+# Tables whose b-trees the first requests read, per database
+HOT_TABLES = ("users", "posts", "clothes", "item_stats", "table_versions")
+
+_report = {"ready": False, "finished": False, "stages": {}, "errors": {}}
+_static_files = None
+# mtime of the build directory when it was scanned; a new build changes it
+_static_mtime = None
+
+
+def make_clothes_dirs(clothes_dir=CLOTHES_DIR):
+    for subdir in CLOTHES_SUBDIRS:
+        os.makedirs(os.path.join(clothes_dir, subdir), exist_ok=True)
+
+
+def migrate():
+    """Create every table and index the app expects on the core database and each shard"""
+    for index in all_shards():
+        conn = connect_shard(index)
+        try:
+            ensure_version_table(conn)
+            ensure_stats_table(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+    conn = connect(CORE_DB)
+    try:
+        ensure_events_table(conn)
+        conn.commit()
+        post_search.ensure_posts_fts(conn)
+    finally:
+        conn.close()
+
+
+def warm_databases(max_bytes=WARM_DB_BYTES):
+    """Read each database file ahead and touch its hot tables, so first queries hit cached pages"""
+    for index in all_shards():
+        path = shard_path(index)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            remaining = max_bytes
+            while remaining > 0 and f.read(min(CHUNK_SIZE, remaining)):
+                remaining -= CHUNK_SIZE
+
+        conn = connect(path)
+        try:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            for table in HOT_TABLES:
+                if table in tables:
+                    conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        finally:
+            conn.close()
+
+
+def load_image_index():
+    get_index().load()
+
+
+def load_vectors():
+    """Load the feature matrix and page it in, the first similarity query reads all of it"""
+    store = get_store()
+    store.load()
+    if len(store.vectors):
+        store.vectors.sum()
+
+
+def _folder_mtime(static_folder):
+    try:
+        return os.stat(static_folder).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def scan_static(static_folder):
+    """Remember which files the React build contains, so serving a path needs no stat"""
+    global _static_files, _static_mtime
+    _static_mtime = _folder_mtime(static_folder)
+    files = set()
+    if static_folder and os.path.isdir(static_folder):
+        for root, _, names in os.walk(static_folder):
+            for name in names:
+                files.add(os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, "/"))
+    _static_files = frozenset(files)
+
+
+def static_file_exists(static_folder, path):
+    """Whether the React build has this file.
+
+    Manifest hits need no stat. A miss rescans when the build directory
+    changed since the scan, and otherwise asks the filesystem, so files
+    from a rebuild in place are served without a restart.
+    """
+    if _static_files is not None:
+        if path in _static_files:
+            return True
+        if _folder_mtime(static_folder) != _static_mtime:
+            scan_static(static_folder)
+            if path in _static_files:
+                return True
+    return os.path.isfile(os.path.join(static_folder, path))
+
+
+def run_warmup(app):
+    """Run every stage, timing each one; a failed stage is logged and skipped,
+    and leaves the worker finished but not ready"""
+    global _report
+    stages = [
+        ("directories", make_clothes_dirs),
+        ("migrations", migrate),
+        ("databases", warm_databases),
+        ("image_index", load_image_index),
+        ("vectors", load_vectors),
+        ("static_manifest", lambda: scan_static(app.static_folder))
+    ]
+
+    report = {"ready": False, "finished": False, "stages": {}, "errors": {}}
+    _report = report
+    started = time.perf_counter()
+    for name, stage in stages:
+        stage_started = time.perf_counter()
+        try:
+            stage()
+        except Exception as e:
+            print(f"Warmup stage {name} failed: {e}")
+            report["errors"][name] = str(e)
+        report["stages"][name] = round((time.perf_counter() - stage_started) * 1000, 2)
+
+    report["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    report["finished"] = True
+    report["ready"] = not report["errors"]
+    breakdown = ", ".join(f"{name} {ms} ms" for name, ms in report["stages"].items())
+    print(f"Warmup finished in {report['total_ms']} ms: {breakdown}")
+    if report["errors"]:
+        print(f"Warmup degraded, failed stages: {', '.join(report['errors'])}")
+    return report
+
+
+def start_warmup(app, mode=WARMUP_MODE):
+    if mode == "off":
+        _report["ready"] = _report["finished"] = True
+        return None
+    if mode == "sync":
+        run_warmup(app)
+        return None
+
+    worker = threading.Thread(target=run_warmup, args=(app,), name="warmup", daemon=True)
+    worker.start()
+    return worker
+
+
+def warmup_report():
+    return _report
@@ -32,22 +32,33 @@ export default function AddClothes() {
         setLoading(true);
         setMessage('');
 
+        const postItem = (allowDuplicate) => fetch('/user/add-clothing', {
+            method: 'POST',
+            credentials: 'include',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                name: formData.name,
+                type: formData.type,
+                body_part: formData.bodyPart,
+                image_path: formData.imagePath,
+                allow_duplicate: allowDuplicate
+            })
+        });
+
         try {
-            const response = await fetch('/user/add-clothing', {
-                method: 'POST',
-                credentials: 'include',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    name: formData.name,
-                    type: formData.type,
-                    body_part: formData.bodyPart,
-                    image_path: formData.imagePath
-                })
-            });
-
-            const data = await response.json();
+            let response = await postItem(false);
+            let data = await response.json();
+
+            // 409: the image looks like one already added, let the user decide
+            if (response.status === 409) {
+                const names = (data.duplicates || []).map(item => item.name).join(', ');
+                if (window.confirm(`A very similar image already exists (${names}). Add it anyway?`)) {
+                    response = await postItem(true);
+                    data = await response.json();
+                }
+            }
 
             if (response.ok) {
                 setMessage('Clothing item added successfully!');
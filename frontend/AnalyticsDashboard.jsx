@@ -11,6 +11,26 @@ export default function AnalyticsDashboard() {
         fetchAnalytics();
     }, []);
 
+    // The server pushes only the counts that changed; merge them into what we have
+    useEffect(() => {
+        const source = new EventSource('/api/admin/events', { withCredentials: true });
+        source.addEventListener('analytics', (event) => {
+            const changes = JSON.parse(event.data);
+            setAnalytics((current) => mergeCounts(current || {}, changes));
+        });
+        return () => source.close();
+    }, []);
+
+    const mergeCounts = (current, changes) => {
+        const merged = { ...current };
+        Object.entries(changes).forEach(([key, value]) => {
+            merged[key] = value !== null && typeof value === 'object'
+                ? mergeCounts(current[key] || {}, value)
+                : value;
+        });
+        return merged;
+    };
+
     const fetchAnalytics = async () => {
         try {
             setLoading(true);
@@ -19,7 +19,7 @@ export default function FilterScreen() {
         setLoading(true);
         setError('');
         try {
-            const response = await fetch('/filter');
+            const response = await fetch('/filter?scope=mine&shared=1', { credentials: 'include' });
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
@@ -43,9 +43,11 @@ export default function FilterScreen() {
         if (type) params.append('type', type);
         if (part) params.append('part', part);
         if (name) params.append('name', name);
+        params.append('scope', 'mine');
+        params.append('shared', '1');
 
         try {
-            const response = await fetch(`/filter?${params.toString()}`);
+            const response = await fetch(`/filter?${params.toString()}`, { credentials: 'include' });
 
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -10,11 +10,33 @@ export default function ManageContent() {
     const [editPostId, setEditPostId] = useState(null);
     const [editFilename, setEditFilename] = useState("");
     const [editLabel, setEditLabel] = useState("");
+    const [searchText, setSearchText] = useState("");
 
     useEffect(() => {
         fetchPosts();
     }, []);
 
+    // Changes made by any admin arrive over the event stream and are patched in place
+    useEffect(() => {
+        const source = new EventSource("/api/admin/events", { withCredentials: true });
+        source.addEventListener("post_updated", (event) => {
+            const change = JSON.parse(event.data);
+            updatePost(change.id, change);
+        });
+        source.addEventListener("post_deleted", (event) => {
+            removePost(JSON.parse(event.data).id);
+        });
+        return () => source.close();
+    }, []);
+
+    const updatePost = (id, changes) => {
+        setPosts((current) => current.map((post) => (post.id === id ? { ...post, ...changes } : post)));
+    };
+
+    const removePost = (id) => {
+        setPosts((current) => current.filter((post) => post.id !== id));
+    };
+
     const fetchPosts = async () => {
         try {
             setLoading(true);
@@ -37,6 +59,36 @@ export default function ManageContent() {
         }
     };
 
+    // Server-side full-text search, only the matching page of posts is downloaded
+    const searchPosts = async () => {
+        if (!searchText.trim()) {
+            fetchPosts();
+            return;
+        }
+        try {
+            setError('');
+            const params = new URLSearchParams({ q: searchText, per_page: '50' });
+            const response = await fetch(`/auth/admin/posts/search?${params.toString()}`, {
+                credentials: "include",
+            });
+
+            if (response.ok) {
+                const data = await response.json();
+                setPosts(data.results);
+            } else {
+                setError('Failed to search posts');
+            }
+        } catch (error) {
+            console.error("Error searching posts:", error);
+            setError('Error connecting to server');
+        }
+    };
+
+    const clearSearch = () => {
+        setSearchText("");
+        fetchPosts();
+    };
+
     const approvePosts = async (id) => {
         try {
             const response = await fetch(`/auth/admin/posts/${id}/approve`, {
@@ -45,7 +97,7 @@ export default function ManageContent() {
             });
 
             if (response.ok) {
-                fetchPosts(); // Refresh the list
+                updatePost(id, { status: "approved" });
             } else {
                 alert('Failed to approve post');
             }
@@ -64,7 +116,7 @@ export default function ManageContent() {
                 });
 
                 if (response.ok) {
-                    fetchPosts(); // Refresh the list
+                    removePost(id);
                 } else {
                     alert('Failed to delete post');
                 }
@@ -97,10 +149,10 @@ export default function ManageContent() {
             });
 
             if (response.ok) {
+                updatePost(editPostId, { title: editFilename, body: editLabel });
                 setEditPostId(null);
                 setEditFilename("");
                 setEditLabel("");
-                fetchPosts(); // Refresh the list
             } else {
                 alert('Failed to update post');
             }
@@ -179,6 +231,23 @@ export default function ManageContent() {
                 </button>
             </div>
 
+            <div style={{ marginBottom: '1.5rem', display: 'flex', gap: '0.5rem' }}>
+                <input
+                    value={searchText}
+                    onChange={(e) => setSearchText(e.target.value)}
+                    onKeyDown={(e) => e.key === 'Enter' && searchPosts()}
+                    placeholder="Search posts by title, body or author..."
+                    style={{
+                        flex: 1,
+                        padding: '0.5rem',
+                        border: '1px solid #ddd',
+                        borderRadius: '4px'
+                    }}
+                />
+                <button onClick={searchPosts}>Search</button>
+                <button onClick={clearSearch}>Clear</button>
+            </div>
+
             {posts.length === 0 ? (
                 <div style={{ textAlign: 'center', marginTop: '2rem', padding: '2rem', backgroundColor: '#f8f9fa', borderRadius: '8px' }}>
                     <h3>No Posts Found</h3>
@@ -11,6 +11,31 @@ export default function ManageUsers() {
         fetchUsers();
     }, []);
 
+    // Changes made by any admin arrive over the event stream and are patched in place
+    useEffect(() => {
+        const source = new EventSource("/api/admin/events", { withCredentials: true });
+        source.addEventListener("user_added", (event) => {
+            const user = JSON.parse(event.data);
+            setUsers((current) => (current.some((u) => u.id === user.id) ? current : [...current, user]));
+        });
+        source.addEventListener("user_updated", (event) => {
+            const change = JSON.parse(event.data);
+            updateUser(change.id, change);
+        });
+        source.addEventListener("user_deleted", (event) => {
+            removeUser(JSON.parse(event.data).id);
+        });
+        return () => source.close();
+    }, []);
+
+    const updateUser = (id, changes) => {
+        setUsers((current) => current.map((user) => (user.id === id ? { ...user, ...changes } : user)));
+    };
+
+    const removeUser = (id) => {
+        setUsers((current) => current.filter((user) => user.id !== id));
+    };
+
     const fetchUsers = async () => {
         try {
             setLoading(true);
@@ -42,7 +67,10 @@ export default function ManageUsers() {
             });
 
             if (response.ok) {
-                fetchUsers(); // Refresh the list
+                const user = users.find((u) => u.id === id);
+                if (user) {
+                    updateUser(id, { active: !user.active });
+                }
             } else {
                 alert('Failed to update user status');
             }
@@ -61,7 +89,7 @@ export default function ManageUsers() {
                 });
 
                 if (response.ok) {
-                    fetchUsers(); // Refresh the list
+                    removeUser(id);
                 } else {
                     alert('Failed to delete user');
                 }
@@ -22,14 +22,15 @@ export default function PickOutfit() {
             setLoading(true);
             setError('');
 
-            // Use relative URLs
-            const topsResponse = await fetch('/filter?part=top');
+            // Use relative URLs, scoped to the user's wardrobe plus the shared catalog, most worn first
+            const scope = 'scope=mine&shared=1&sort=popular';
+            const topsResponse = await fetch(`/filter?part=top&${scope}`, { credentials: 'include' });
             const topsData = await topsResponse.json();
 
-            const bottomsResponse = await fetch('/filter?part=bottom');
+            const bottomsResponse = await fetch(`/filter?part=bottom&${scope}`, { credentials: 'include' });
             const bottomsData = await bottomsResponse.json();
 
-            const shoesResponse = await fetch('/filter?part=shoes');
+            const shoesResponse = await fetch(`/filter?part=shoes&${scope}`, { credentials: 'include' });
             const shoesData = await shoesResponse.json();
 
             if (topsData.length === 0 && bottomsData.length === 0 && shoesData.length === 0) {